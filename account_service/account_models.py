@@ -12,6 +12,9 @@ db = SQLAlchemy(model_class=Base)
 class Account(db.Model):
     """Account model for account service"""
     __tablename__ = 'accounts'
+    __table_args__ = (
+        db.Index('ix_accounts_type_status', 'account_type', 'status'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), nullable=False, index=True)
@@ -19,6 +22,8 @@ class Account(db.Model):
                               default=lambda: f"ACC{uuid.uuid4().hex[:8].upper()}")
     account_type = db.Column(db.String(20), nullable=False)
     balance = db.Column(db.Float, default=0.0)
+    # Last ledger posting reflected in balance when the transaction service runs in ledger mode
+    ledger_posting_id = db.Column(db.Integer)
     status = db.Column(db.String(20), default='active')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -1,135 +1,64 @@
 import os
-import consul
 import logging
+import requests
+import service_client
+import http_responses
 import jwt
 from datetime import datetime
 from functools import wraps
 from flask import Flask, request, jsonify
 from account_service.account_models import db, Account
+from event_bus import EventBus
+from http_caching import conditional_json, etag_for
+from service_registry import register_in_background
+from schema_upgrade import add_missing_columns, create_missing_indexes
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Consul configuration
-CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
-CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
 SERVICE_NAME = "account-service"
-SERVICE_ID = f"{SERVICE_NAME}-{os.urandom(8).hex()}"
-SERVICE_PORT = 8002
-
-# Initialize Consul client
-consul_client = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-
-# Register service with Consul
-def register_service():
-    consul_client.agent.service.register(
-        name=SERVICE_NAME,
-        service_id=SERVICE_ID,
-        address="localhost",
-        port=SERVICE_PORT,
-        check=consul.Check.http(
-            f"http://localhost:{SERVICE_PORT}/api/health",
-            interval="10s",
-            timeout="5s",
-        ),
-    )
-    logger.info(f"Registered service with Consul as {SERVICE_ID}")
-
-# Deregister service from Consul
-def deregister_service():
-    consul_client.agent.service.deregister(SERVICE_ID)
-    logger.info(f"Deregistered service from Consul: {SERVICE_ID}")
+# Address this instance listens on and registers in the service registry; give each instance
+# its own (a host or IP other services can reach) when running several
+SERVICE_HOST = os.environ.get("ACCOUNT_SERVICE_HOST", "localhost")
+SERVICE_PORT = int(os.environ.get("ACCOUNT_SERVICE_PORT", 8002))
 
 # Initialize Flask app
 app = Flask(__name__)
+http_responses.init_app(app)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("ACCOUNT_DATABASE_URL")
 app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "account_service_secret_key")
 
 # Initialize extensions
 db.init_app(app)
 
-# Create tables
-with app.app_context():
-    db.create_all()
-# Register service on startup
-with app.app_context():
-    register_service()
-
-# Deregister service on shutdown
-import atexit
-atexit.register(deregister_service)
-
-import consul
-
-# Consul configuration
-CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
-CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
-SERVICE_NAME = "account-service"
-SERVICE_ID = f"{SERVICE_NAME}-{os.urandom(8).hex()}"
-SERVICE_PORT = 8002
-
-# Initialize Consul client
-consul_client = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-
-# Register service with Consul
-def register_service():
-    consul_client.agent.service.register(
-        name=SERVICE_NAME,
-        service_id=SERVICE_ID,
-        address="localhost",
-        port=SERVICE_PORT,
-        check=consul.Check.http(
-            f"http://localhost:{SERVICE_PORT}/api/health",
-            interval="10s",
-            timeout="5s",
-        ),
-    )
-    logger.info(f"Registered service with Consul as {SERVICE_ID}")
-
-# Deregister service from Consul
-def deregister_service():
-    consul_client.agent.service.deregister(SERVICE_ID)
-    logger.info(f"Deregistered service from Consul: {SERVICE_ID}")
-
-# Register service on startup
-with app.app_context():
-    register_service()
-
-# Deregister service on shutdown
-import atexit
-atexit.register(deregister_service)
-
-import os
-import logging
-import requests
-import jwt
-from datetime import datetime
-from functools import wraps
-from flask import Flask, request, jsonify
+# Authentication service URL
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
 
-import logging
+# Largest page the admin account listing will return
+ADMIN_MAX_PAGE_SIZE = int(os.environ.get("ADMIN_MAX_PAGE_SIZE", 100))
 
-import logging
+# Most ids/account numbers accepted by a single batch lookup
+MAX_BATCH_SIZE = int(os.environ.get("ACCOUNT_MAX_BATCH_SIZE", 100))
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+# Cross-service change notifications; durable so ledger postings made while this service was
+# down are still applied to balances when it starts again
+event_bus = EventBus(SERVICE_NAME, durable=True)
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("ACCOUNT_DATABASE_URL")
-app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "account_service_secret_key")
-
-# Initialize extensions
-db.init_app(app)
-
-# Create tables
-with app.app_context():
-    db.create_all()
+def apply_ledger_posting(topic, payload):
+    """Project a balance posted to the transaction service ledger onto the account"""
+    with app.app_context():
+        account = Account.query.filter_by(id=payload['account_id']).first()
+        
+        # Events may arrive out of order; never move back to an older posting
+        if not account or (account.ledger_posting_id or 0) >= payload['posting_id']:
+            return
+        
+        account.balance = payload['balance']
+        account.ledger_posting_id = payload['posting_id']
+        db.session.commit()
 
-# Authentication service URL
-AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
+event_bus.subscribe('ledger.posted', apply_ledger_posting)
 
 # Helper functions
 def token_required(f):
@@ -147,7 +76,7 @@ def token_required(f):
         
         try:
             # Verify token with auth service
-            response = requests.get(
+            response = service_client.get(
                 f"{AUTH_SERVICE_URL}/api/auth/verify_token",
                 headers={'Authorization': f'Bearer {token}'}
             )
@@ -176,7 +105,7 @@ def admin_required(f):
         token = request.headers.get('Authorization').split(' ')[1]
         
         try:
-            response = requests.get(
+            response = service_client.get(
                 f"{AUTH_SERVICE_URL}/api/auth/verify_admin",
                 headers={'Authorization': f'Bearer {token}'}
             )
@@ -251,6 +180,12 @@ def create_account(current_user):
         db.session.add(new_account)
         db.session.commit()
         
+        event_bus.publish('account.created', {
+            'account_id': new_account.id,
+            'user_id': new_account.user_id,
+            'account_type': new_account.account_type
+        })
+        
         return jsonify({
             'message': 'Account created successfully',
             'account': new_account.to_dict()
@@ -269,8 +204,58 @@ def get_account_details(current_user, account_id):
         # Check if the account belongs to the current user
         if account.user_id != current_user['user_id'] and current_user['role'] != 'admin':
             return jsonify({'message': 'Access denied'}), 403
-            
-        return jsonify(account.to_dict()), 200
+        
+        # Balance and status are what change; a client holding this version gets a 304
+        account_dict = account.to_dict()
+        return conditional_json(etag_for(*account_dict.values()), lambda: account_dict)
+
+@app.route('/api/accounts/batch', methods=['POST'])
+@token_required
+def batch_accounts(current_user):
+    """Look up many accounts by id and/or account number in one query
+    
+    Every account found is returned with its status and whether the caller owns it;
+    balances and owners are only included for the caller's own accounts (or for admins).
+    """
+    data = request.json or {}
+    ids = data.get('ids', [])
+    account_numbers = data.get('account_numbers', [])
+    
+    if not isinstance(ids, list) or not isinstance(account_numbers, list):
+        return jsonify({'message': 'ids and account_numbers must be lists'}), 400
+    
+    if len(ids) + len(account_numbers) > MAX_BATCH_SIZE:
+        return jsonify({'message': f'At most {MAX_BATCH_SIZE} accounts can be looked up at once'}), 400
+    
+    with app.app_context():
+        accounts = Account.query.filter(
+            Account.id.in_(ids) | Account.account_number.in_(account_numbers)
+        ).all() if ids or account_numbers else []
+        
+        results = []
+        for account in accounts:
+            owned = account.user_id == current_user['user_id']
+            if owned or current_user['role'] == 'admin':
+                result = account.to_dict()
+            else:
+                result = {
+                    'id': account.id,
+                    'account_number': account.account_number,
+                    'account_type': account.account_type,
+                    'status': account.status
+                }
+            result['owned'] = owned
+            results.append(result)
+    
+    found_ids = {a['id'] for a in results}
+    found_numbers = {a['account_number'] for a in results}
+    return jsonify({
+        'accounts': results,
+        'missing': {
+            'ids': [i for i in ids if i not in found_ids],
+            'account_numbers': [n for n in account_numbers if n not in found_numbers]
+        }
+    }), 200
 
 @app.route('/api/accounts/close/<account_id>', methods=['DELETE'])
 @token_required
@@ -298,6 +283,8 @@ def close_account(current_user, account_id):
         account.status = 'closed'
         db.session.commit()
         
+        event_bus.publish('account.closed', {'account_id': account.id, 'user_id': account.user_id})
+        
         return jsonify({
             'message': 'Account closed successfully',
             'account': account.to_dict()
@@ -307,13 +294,77 @@ def close_account(current_user, account_id):
 @token_required
 @admin_required
 def get_all_accounts(current_user):
-    """Get all accounts (admin only)"""
+    """Get all accounts (admin only)
+    
+    Optional filters: status, account_type, user_id. Passing page (and per_page)
+    returns a single page plus pagination metadata instead of every account.
+    """
     with app.app_context():
-        accounts = Account.query.all()
+        query = Account.query
+        for field in ('status', 'account_type', 'user_id'):
+            if request.args.get(field):
+                query = query.filter(getattr(Account, field) == request.args[field])
+        
+        if 'page' not in request.args:
+            accounts = query.all()
+            return jsonify({
+                'accounts': [account.to_dict() for account in accounts]
+            }), 200
+        
+        page = query.order_by(Account.created_at.desc(), Account.id).paginate(
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 25, type=int),
+            max_per_page=ADMIN_MAX_PAGE_SIZE,
+            error_out=False
+        )
         return jsonify({
-            'accounts': [account.to_dict() for account in accounts]
+            'accounts': [account.to_dict() for account in page.items],
+            'pagination': {
+                'page': page.page,
+                'per_page': page.per_page,
+                'total': page.total,
+                'pages': page.pages
+            }
         }), 200
 
+@app.route('/api/accounts/stats', methods=['GET'])
+@token_required
+@admin_required
+def get_account_stats(current_user):
+    """Account counts and balance totals by type and status (admin only)"""
+    with app.app_context():
+        rows = db.session.query(
+            Account.account_type,
+            Account.status,
+            db.func.count(Account.id),
+            db.func.coalesce(db.func.sum(Account.balance), 0.0)
+        ).group_by(Account.account_type, Account.status).all()
+    
+    stats = {
+        'total_accounts': 0,
+        'total_balance': 0.0,
+        'active_accounts': 0,
+        'closed_accounts': 0,
+        'account_types': {},
+        'by_status': {}
+    }
+    for account_type, status, count, balance in rows:
+        stats['total_accounts'] += count
+        stats['total_balance'] += balance
+        
+        type_stats = stats['account_types'].setdefault(account_type, {'count': 0, 'balance': 0.0})
+        type_stats['count'] += count
+        type_stats['balance'] += balance
+        
+        status_stats = stats['by_status'].setdefault(status, {'count': 0, 'balance': 0.0})
+        status_stats['count'] += count
+        status_stats['balance'] += balance
+    
+    stats['active_accounts'] = stats['by_status'].get('active', {}).get('count', 0)
+    stats['closed_accounts'] = stats['by_status'].get('closed', {}).get('count', 0)
+    
+    return jsonify(stats), 200
+
 @app.route('/api/accounts/update/<account_id>', methods=['PUT'])
 @token_required
 @admin_required
@@ -331,11 +382,16 @@ def update_account(current_user, account_id):
         allowed_fields = ['account_type', 'status']
         updates = {k: v for k, v in data.items() if k in allowed_fields}
         
+        previous_status = account.status
+        
         for key, value in updates.items():
             setattr(account, key, value)
         
         db.session.commit()
         
+        if account.status == 'closed' and previous_status != 'closed':
+            event_bus.publish('account.closed', {'account_id': account.id, 'user_id': account.user_id})
+        
         return jsonify({
             'message': 'Account updated successfully',
             'account': account.to_dict()
@@ -388,6 +444,14 @@ def update_balance():
         
         db.session.commit()
         
+        event_bus.publish('account.balance_changed', {
+            'account_id': account.id,
+            'user_id': account.user_id,
+            'balance': account.balance,
+            'operation': operation,
+            'amount': amount
+        })
+        
         return jsonify({
             'message': 'Balance updated successfully',
             'account': account.to_dict()
@@ -417,5 +481,24 @@ def validate_account(account_id):
             'account': account.to_dict()
         }), 200
 
+# Startup runs once per process, whichever entry point asks for the app first
+started = False
+
+def create_app():
+    """Run the service's startup tasks once and return the app.
+    Importing this module performs no database or network I/O; servers call this instead."""
+    global started
+    if started:
+        return app
+    started = True
+    
+    with app.app_context():
+        db.create_all()
+        add_missing_columns(db, Account)
+        create_missing_indexes(db, Account)
+    event_bus.start()
+    register_in_background(SERVICE_NAME, SERVICE_PORT, address=SERVICE_HOST)
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='localhost', port=8002)
\ No newline at end of file
+    create_app().run(debug=True, host=SERVICE_HOST, port=SERVICE_PORT)
\ No newline at end of file
@@ -1,7 +1,12 @@
 import os
 import json
+import time
 import logging
 import requests
+import service_client
+import single_flight
+import template_cache
+from session_store import session_interface
 from datetime import datetime, timedelta
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from functools import wraps
@@ -15,19 +20,25 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+template_cache.init_app(app)
 
-# Configure session
-app.config['SESSION_TYPE'] = 'filesystem'
+# Configure session; its data is kept server-side (see SESSION_STORE), the cookie only holds an id
+app.session_interface = session_interface()
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)  # Sessions last for 1 day
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
 # Microservice URLs
-AUTH_SERVICE_URL = "http://0.0.0.0:8001"
-ACCOUNT_SERVICE_URL = "http://0.0.0.0:8002"
-TRANSACTION_SERVICE_URL = "http://0.0.0.0:8003"
-REPORTING_SERVICE_URL = "http://0.0.0.0:8004"
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
+ACCOUNT_SERVICE_URL = os.environ.get("ACCOUNT_SERVICE_URL", "http://localhost:8002")
+TRANSACTION_SERVICE_URL = os.environ.get("TRANSACTION_SERVICE_URL", "http://localhost:8003")
+REPORTING_SERVICE_URL = os.environ.get("REPORTING_SERVICE_URL", "http://localhost:8004")
+
+# How long a verified profile in the session is trusted before the token is checked again (seconds)
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 30))
+# How long a verified profile stays logged in while the auth service cannot be reached (seconds)
+PROFILE_OUTAGE_GRACE = float(os.environ.get("PROFILE_OUTAGE_GRACE", 5 * PROFILE_CACHE_TTL))
 
 # Helper functions
 def login_required(f):
@@ -37,25 +48,40 @@ def login_required(f):
             flash('Please log in to access this page', 'danger')
             return redirect(url_for('login'))
             
-        # Verify token is still valid by making a request to auth service
-        try:
-            verify_response = make_auth_request('GET', 'verify_token', token=session['token'])
-            
-            # If token verification fails, clear session and redirect to login
-            if not verify_response or verify_response.status_code != 200:
-                logger.warning(f"Invalid token detected. Forcing logout. Response: {verify_response}")
-                session.clear()
-                flash('Your session has expired. Please log in again.', 'warning')
-                return redirect(url_for('login'))
-                
-        except Exception as e:
-            logger.error(f"Error verifying token: {str(e)}")
-            # Allow the request to continue even if auth service is down temporarily
-            # This prevents users from being locked out if auth service has a brief outage
+        # Verify token is still valid, at most once per PROFILE_CACHE_TTL
+        if load_profile() is None:
+            logger.warning("Invalid token detected. Forcing logout.")
+            session.clear()
+            flash('Your session has expired. Please log in again.', 'warning')
+            return redirect(url_for('login'))
             
         return f(*args, **kwargs)
     return decorated_function
 
+def load_profile():
+    """Get the logged-in user's profile, cached in the session for PROFILE_CACHE_TTL.
+
+    Fetching the profile also verifies the token, so a page needs no separate
+    verify_token call. Returns None if the token is no longer valid, or if the auth
+    service is down and the profile was last verified more than PROFILE_OUTAGE_GRACE ago.
+    """
+    profile = session.get('profile')
+    age = time.time() - session.get('profile_verified_at', 0)
+    if profile and age < PROFILE_CACHE_TTL:
+        return profile
+
+    response = make_auth_request('GET', 'users/profile', token=session['token'])
+    if response is None:
+        # Keep users logged in through a brief auth service outage
+        logger.error("Error verifying token: auth service unavailable")
+        return profile if profile and age < PROFILE_OUTAGE_GRACE else None
+    if response.status_code != 200:
+        return None
+
+    session['profile'] = response.json()
+    session['profile_verified_at'] = time.time()
+    return session['profile']
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -65,7 +91,7 @@ def admin_required(f):
         
         # Verify admin role
         headers = {'Authorization': f'Bearer {session["token"]}'}
-        response = requests.get(f"{AUTH_SERVICE_URL}/api/auth/verify_admin", headers=headers)
+        response = single_flight.get(f"{AUTH_SERVICE_URL}/api/auth/verify_admin", headers=headers)
         
         if not response.ok or not response.json().get('is_admin'):
             flash('You do not have admin privileges', 'danger')
@@ -92,13 +118,13 @@ def make_auth_request(method, endpoint, data=None, token=None, params=None):
 
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, params=params)
+            response = single_flight.get(url, headers=headers, params=params)
         elif method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
+            response = service_client.post(url, json=data, headers=headers)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
+            response = service_client.put(url, json=data, headers=headers)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
+            response = service_client.delete(url, headers=headers)
         
         logger.debug(f"Response status: {response.status_code}")
         return response
@@ -106,48 +132,15 @@ def make_auth_request(method, endpoint, data=None, token=None, params=None):
         logger.error(f"Auth service request failed: {e}")
         return None
 
-import consul
-
-CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
-CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
-
-consul_client = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-
 def get_service_url(service_name):
-    """Get service URL from Consul or fall back to hardcoded URL."""
-    try:
-        index, data = consul_client.health.service(service_name, passing=True)
-        if data:
-            service = data[0]['Service']
-            address = service['Address']
-            port = service['Port']
-            return f"http://{address}:{port}"
-        else:
-            logger.warning(f"No healthy instances of {service_name} found in Consul")
-            # Fall back to hardcoded URLs
-            if service_name == "auth-service":
-                return AUTH_SERVICE_URL
-            elif service_name == "account-service":
-                return ACCOUNT_SERVICE_URL
-            elif service_name == "transaction-service":
-                return TRANSACTION_SERVICE_URL
-            elif service_name == "reporting-service":
-                return REPORTING_SERVICE_URL
-            else:
-                return None
-    except Exception as e:
-        logger.error(f"Error querying Consul for {service_name}: {e}")
-        # Fall back to hardcoded URLs
-        if service_name == "auth-service":
-            return AUTH_SERVICE_URL
-        elif service_name == "account-service":
-            return ACCOUNT_SERVICE_URL
-        elif service_name == "transaction-service":
-            return TRANSACTION_SERVICE_URL
-        elif service_name == "reporting-service":
-            return REPORTING_SERVICE_URL
-        else:
-            return None
+    """Get the configured URL of a service; service_client resolves it to a live instance
+    through service discovery (see DISCOVERY_BACKEND)."""
+    return {
+        "auth-service": AUTH_SERVICE_URL,
+        "account-service": ACCOUNT_SERVICE_URL,
+        "transaction-service": TRANSACTION_SERVICE_URL,
+        "reporting-service": REPORTING_SERVICE_URL,
+    }.get(service_name)
 
 def make_account_request(method, endpoint, data=None, token=None, params=None):
     headers = {}
@@ -167,13 +160,13 @@ def make_account_request(method, endpoint, data=None, token=None, params=None):
 
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, params=params)
+            response = single_flight.get(url, headers=headers, params=params)
         elif method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
+            response = service_client.post(url, json=data, headers=headers)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
+            response = service_client.put(url, json=data, headers=headers)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
+            response = service_client.delete(url, headers=headers)
         
         logger.debug(f"Response status: {response.status_code}")
         return response
@@ -199,13 +192,13 @@ def make_transaction_request(method, endpoint, data=None, token=None, params=Non
 
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, params=params)
+            response = single_flight.get(url, headers=headers, params=params)
         elif method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
+            response = service_client.post(url, json=data, headers=headers)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
+            response = service_client.put(url, json=data, headers=headers)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
+            response = service_client.delete(url, headers=headers)
         
         logger.debug(f"Response status: {response.status_code}")
         return response
@@ -231,13 +224,13 @@ def make_reporting_request(method, endpoint, data=None, token=None, params=None)
 
     try:
         if method == 'GET':
-            response = requests.get(url, headers=headers, params=params if params else data)
+            response = single_flight.get(url, headers=headers, params=params if params else data)
         elif method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
+            response = service_client.post(url, json=data, headers=headers)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
+            response = service_client.put(url, json=data, headers=headers)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
+            response = service_client.delete(url, headers=headers)
         
         logger.debug(f"Response status: {response.status_code}")
         return response
@@ -276,6 +269,8 @@ def login():
             
             if response and response.status_code == 200:
                 data = response.json()
+                # Start a fresh session id for the logged-in user
+                session.regenerate()
                 # Store auth data in session
                 session['token'] = data.get('token')
                 session['user_id'] = data.get('user_id')
@@ -336,9 +331,8 @@ def register():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Get user profile info
-    profile_response = make_auth_request('GET', f'users/profile', token=session['token'])
-    profile_data = profile_response.json() if profile_response and profile_response.status_code == 200 else {}
+    # User profile info, cached by login_required
+    profile_data = load_profile() or {}
     
     # Get account summary
     accounts_response = make_account_request('GET', 'list', token=session['token'])
@@ -360,37 +354,15 @@ def dashboard():
 @login_required
 def profile():
     """User profile page"""
-    try:
-        # Get user profile info from auth service with additional error handling
-        profile_response = make_auth_request('GET', 'users/profile', token=session['token'])
-        
-        if profile_response and profile_response.status_code == 200:
-            profile_data = profile_response.json()
-            logger.debug(f"Successfully loaded profile data for user: {session.get('username')}")
-            return render_template('profile.html', profile=profile_data)
-        elif profile_response and profile_response.status_code == 401:
-            # Token is invalid/expired - clear session and redirect to login
-            logger.warning("Invalid token detected in profile route")
-            session.clear()
-            flash('Your session has expired. Please log in again.', 'warning')
-            return redirect(url_for('login'))
-        else:
-            # Other API error
-            error_msg = "Failed to load profile information"
-            if profile_response and hasattr(profile_response, 'json'):
-                try:
-                    error_data = profile_response.json()
-                    if 'message' in error_data:
-                        error_msg = error_data['message']
-                except:
-                    pass
-            
-            flash(error_msg, 'danger')
-            return redirect(url_for('dashboard'))
-    except Exception as e:
-        logger.error(f"Error loading profile: {str(e)}")
-        flash('An error occurred while loading your profile. Please try again.', 'danger')
-        return redirect(url_for('dashboard'))
+    # login_required has just loaded (and verified) the profile
+    profile_data = load_profile()
+    
+    if profile_data:
+        logger.debug(f"Successfully loaded profile data for user: {session.get('username')}")
+        return render_template('profile.html', profile=profile_data)
+    
+    flash('Failed to load profile information', 'danger')
+    return redirect(url_for('dashboard'))
 
 @app.route('/profile/update', methods=['POST'])
 @login_required
@@ -416,6 +388,8 @@ def update_profile():
     response = make_auth_request('PUT', 'users/profile', data=data, token=session['token'])
     
     if response and response.status_code == 200:
+        # Show the updated profile on the next page instead of the cached one
+        session.pop('profile', None)
         flash('Profile updated successfully', 'success')
     else:
         error_data = response.json() if response else {"message": "Service unavailable"}
@@ -613,16 +587,12 @@ def health_check():
         key = service_info["key"]
         direct_url = service_info["url"]
         
-        # First try consul service discovery
-        service_url = get_service_url(service_name)
-        
-        # If consul fails, use direct URL
-        if not service_url:
-            service_url = direct_url
+        # service_client routes this to one of the discovered instances
+        service_url = get_service_url(service_name) or direct_url
             
         if service_url:
             try:
-                health_response = requests.get(f"{service_url}/api/health", timeout=2)
+                health_response = service_client.get(f"{service_url}/api/health", timeout=2)
                 if health_response.status_code == 200:
                     services_status[key] = "healthy"
                 else:
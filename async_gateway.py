@@ -0,0 +1,681 @@
+"""
+Async API Gateway - The main.py routes and templates served by Quart. Backend calls go through a
+shared httpx connection pool and independent calls run concurrently, so a request waiting on the
+services does not hold a thread.
+
+Requires the optional dependencies: pip install ".[async]"
+Run with: hypercorn async_gateway:app --bind 0.0.0.0:5000
+"""
+
+import os
+import time
+import asyncio
+import logging
+from functools import wraps
+from urllib.parse import urlsplit
+
+import httpx
+from quart import Quart, g, request, jsonify, session, redirect, url_for, render_template
+
+import service_client
+import single_flight
+import template_cache
+from main import (
+    format_date,
+    AUTH_SERVICE_URL,
+    ACCOUNT_SERVICE_URL,
+    TRANSACTION_SERVICE_URL,
+    REPORTING_SERVICE_URL,
+    ADMIN_ACCOUNTS_PER_PAGE,
+    PROFILE_CACHE_TTL,
+    PROFILE_OUTAGE_GRACE,
+    verified_user_data,
+)
+
+logger = logging.getLogger(__name__)
+
+# Initialize Quart app
+app = Quart(__name__)
+app.secret_key = os.environ.get("SESSION_SECRET", "api_gateway_secret_key")
+app.add_template_filter(format_date, 'format_date')
+template_cache.init_app(app)
+
+# Connections to the services shared by all requests; calls beyond the limit wait for a free one
+ASYNC_GATEWAY_MAX_CONNECTIONS = int(os.environ.get("ASYNC_GATEWAY_MAX_CONNECTIONS", 500))
+ASYNC_GATEWAY_PORT = int(os.environ.get("ASYNC_GATEWAY_PORT", 5000))
+
+# Raised by backend calls when a service cannot be reached or its circuit is open
+SERVICE_ERRORS = (httpx.HTTPError, service_client.UpstreamUnavailable)
+
+http_client = None
+inflight_reads = {}  # (full URL, Authorization) -> task of the GET currently in flight
+
+@app.before_serving
+async def open_http_client():
+    """Open the connection pool used for every backend call"""
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=service_client.SERVICE_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=ASYNC_GATEWAY_MAX_CONNECTIONS,
+            max_keepalive_connections=ASYNC_GATEWAY_MAX_CONNECTIONS,
+        ),
+    )
+
+@app.after_serving
+async def close_http_client():
+    """Close the connection pool"""
+    await http_client.aclose()
+
+async def service_request(method, url, **kwargs):
+    """Async counterpart of service_client.request, sharing its service discovery and circuit breakers"""
+    discovery = service_client.discovery
+    target = discovery.service_for(url) if discovery else None
+    instance = None
+    if target is not None:
+        name, base_url = target
+        instance = discovery.acquire(name)
+        url = instance.rstrip('/') + url[len(base_url.rstrip('/')):]
+
+    breaker, _ = service_client.guards_for(urlsplit(url).netloc)
+    try:
+        breaker.before_call()
+        success = False
+        try:
+            response = await http_client.request(method, url, **kwargs)
+            success = response.status_code < 500
+            return response
+        finally:
+            breaker.record(success)
+    except httpx.ConnectError:
+        if instance is not None:
+            discovery.evict(name, instance)
+        raise
+    finally:
+        if instance is not None:
+            discovery.release(instance)
+
+async def shared_get(url, params=None, headers=None):
+    """GET that shares one backend call between identical concurrent requests (see single_flight.py)"""
+    if not single_flight.GATEWAY_SINGLE_FLIGHT:
+        return await service_request('GET', url, params=params, headers=headers)
+
+    key = (str(httpx.URL(url, params=params)), (headers or {}).get('Authorization'))
+    task = inflight_reads.get(key)
+    if task is None:
+        task = asyncio.ensure_future(service_request('GET', url, params=params, headers=headers))
+        inflight_reads[key] = task
+        task.add_done_callback(lambda _: inflight_reads.pop(key, None))
+    # A client disconnecting must not cancel the call for the other waiters
+    return await asyncio.shield(task)
+
+# Logged-in user, as flask-login's current_user in main.py
+class User:
+    def __init__(self, user_data, token):
+        self.id = user_data['user_id']
+        self.username = user_data['username']
+        self.email = user_data.get('email', '')
+        self.role = user_data['role']
+        self.token = token
+        self.is_authenticated = True
+        self.is_active = True
+        self.is_anonymous = False
+
+class AnonymousUser:
+    is_authenticated = False
+    is_active = False
+    is_anonymous = True
+    token = None
+
+@app.before_request
+async def load_user():
+    """Resolve the session's token to the current user, verifying it at most once per PROFILE_CACHE_TTL"""
+    g.user = AnonymousUser()
+    if 'token' not in session:
+        return
+
+    user_data = verified_user_data(session, PROFILE_CACHE_TTL)
+    if user_data:
+        g.user = User(user_data, session['token'])
+        return
+
+    try:
+        response = await shared_get(
+            f"{AUTH_SERVICE_URL}/api/auth/verify_token",
+            headers={'Authorization': f'Bearer {session["token"]}'}
+        )
+        if response.is_success:
+            session['user_data'] = response.json()
+            session['user_verified_at'] = time.time()
+            g.user = User(session['user_data'], session["token"])
+        else:
+            session.pop('user_data', None)
+    except SERVICE_ERRORS:
+        logger.error("Failed to verify token with auth service")
+        # Keep users logged in through a brief auth service outage
+        user_data = verified_user_data(session, PROFILE_OUTAGE_GRACE)
+        if user_data:
+            g.user = User(user_data, session['token'])
+
+@app.context_processor
+async def inject_current_user():
+    return {'current_user': g.get('user', AnonymousUser())}
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if not g.user.is_authenticated:
+            return redirect(url_for('login'))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+# Helper functions for making service requests
+async def make_service_request(service_url, endpoint, method='GET', data=None, params=None, headers=None):
+    """Helper function to make requests to microservices"""
+    url = f"{service_url}{endpoint}"
+
+    # Add authentication token if available
+    if g.user.token:
+        headers = dict(headers or {}, Authorization=f'Bearer {g.user.token}')
+
+    try:
+        if method == 'GET':
+            response = await shared_get(url, params=params, headers=headers)
+        elif method in ('POST', 'PUT'):
+            response = await service_request(method, url, json=data, headers=headers)
+        elif method == 'DELETE':
+            response = await service_request(method, url, headers=headers)
+        else:
+            return {'error': 'Unsupported HTTP method'}, 400
+
+        # Try to parse as JSON
+        try:
+            result = response.json()
+        except ValueError:
+            result = {'data': response.text}
+
+        return result, response.status_code
+
+    except SERVICE_ERRORS as e:
+        logger.error(f"Service request failed: {str(e)}")
+        return {'error': 'Service unavailable'}, 503
+
+async def list_accounts():
+    """Get the current user's accounts, or an empty list"""
+    response, status = await make_service_request(ACCOUNT_SERVICE_URL, '/api/accounts/list')
+    return response.get('accounts', []) if status == 200 else []
+
+# Routes
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/login', methods=['GET', 'POST'])
+async def login():
+    if request.method == 'POST':
+        form = await request.form
+        username = form.get('username')
+        password = form.get('password')
+
+        if not username or not password:
+            return await render_template('login.html', error='Username and password are required')
+
+        # Authenticate with auth service
+        response, status_code = await make_service_request(
+            AUTH_SERVICE_URL,
+            '/api/auth/login',
+            method='POST',
+            data={'username': username, 'password': password}
+        )
+
+        if status_code != 200:
+            return await render_template('login.html', error=response.get('message', 'Authentication failed'))
+
+        session['token'] = response['token']
+        session.pop('user_data', None)
+
+        return redirect(url_for('dashboard'))
+
+    return await render_template('login.html')
+
+@app.route('/logout')
+@login_required
+async def logout():
+    session.pop('token', None)
+    session.pop('user_data', None)
+    return redirect(url_for('index'))
+
+@app.route('/register', methods=['GET', 'POST'])
+async def register():
+    if request.method == 'POST':
+        form = await request.form
+        username = form.get('username')
+        email = form.get('email')
+        password = form.get('password')
+        confirm_password = form.get('confirm_password')
+
+        if not username or not email or not password:
+            return await render_template('register.html', error='All fields are required')
+
+        if password != confirm_password:
+            return await render_template('register.html', error='Passwords do not match')
+
+        # Register with auth service
+        response, status_code = await make_service_request(
+            AUTH_SERVICE_URL,
+            '/api/auth/register',
+            method='POST',
+            data={'username': username, 'email': email, 'password': password}
+        )
+
+        if status_code != 201:
+            return await render_template('register.html', error=response.get('message', 'Registration failed'))
+
+        return redirect(url_for('login', registered=True))
+
+    return await render_template('register.html')
+
+@app.route('/dashboard')
+@login_required
+async def dashboard():
+    # Accounts and recent transactions are fetched concurrently
+    (accounts_response, accounts_status), (transactions_response, transactions_status) = await asyncio.gather(
+        make_service_request(ACCOUNT_SERVICE_URL, '/api/accounts/list'),
+        make_service_request(TRANSACTION_SERVICE_URL, '/api/transactions/recent'),
+    )
+
+    accounts = accounts_response.get('accounts', []) if accounts_status == 200 else []
+    transactions = transactions_response.get('transactions', []) if transactions_status == 200 else []
+
+    return await render_template(
+        'dashboard.html',
+        accounts=accounts,
+        transactions=transactions
+    )
+
+@app.route('/accounts')
+@login_required
+async def accounts():
+    return await render_template('accounts.html', accounts=await list_accounts())
+
+@app.route('/accounts/create', methods=['GET', 'POST'])
+@login_required
+async def create_account():
+    if request.method == 'POST':
+        form = await request.form
+        account_type = form.get('account_type')
+        initial_deposit = form.get('initial_deposit', 0)
+
+        if not account_type:
+            return await render_template('create_account.html', error='Account type is required')
+
+        # Create account with account service
+        response, status = await make_service_request(
+            ACCOUNT_SERVICE_URL,
+            '/api/accounts/create',
+            method='POST',
+            data={'account_type': account_type, 'initial_deposit': float(initial_deposit)}
+        )
+
+        if status != 201:
+            return await render_template('create_account.html', error=response.get('message', 'Failed to create account'))
+
+        return redirect(url_for('accounts'))
+
+    return await render_template('create_account.html')
+
+@app.route('/accounts/<account_id>')
+@login_required
+async def view_account(account_id):
+    (account_response, account_status), (transactions_response, transactions_status) = await asyncio.gather(
+        make_service_request(ACCOUNT_SERVICE_URL, f'/api/accounts/details/{account_id}'),
+        make_service_request(TRANSACTION_SERVICE_URL, f'/api/transactions/account/{account_id}'),
+    )
+
+    if account_status != 200:
+        return await render_template('error.html', error=account_response.get('message', 'Failed to retrieve account'))
+
+    transactions = transactions_response.get('transactions', []) if transactions_status == 200 else []
+
+    return await render_template(
+        'account_details.html',
+        account=account_response,
+        transactions=transactions
+    )
+
+@app.route('/accounts/<account_id>/close', methods=['POST'])
+@login_required
+async def close_account(account_id):
+    response, status = await make_service_request(
+        ACCOUNT_SERVICE_URL,
+        f'/api/accounts/close/{account_id}',
+        method='DELETE'
+    )
+
+    if status != 200:
+        # Return JSON response for AJAX requests
+        return jsonify({'success': False, 'message': response.get('message', 'Failed to close account')}), status
+
+    return jsonify({'success': True})
+
+@app.route('/transactions')
+@login_required
+async def transactions():
+    response, status = await make_service_request(
+        TRANSACTION_SERVICE_URL,
+        '/api/transactions/list'
+    )
+
+    transactions = response.get('transactions', []) if status == 200 else []
+
+    return await render_template('transactions.html', transactions=transactions)
+
+@app.route('/transactions/<transaction_id>')
+@login_required
+async def transaction_detail(transaction_id):
+    response, status = await make_service_request(
+        TRANSACTION_SERVICE_URL,
+        f'/api/transactions/details/{transaction_id}'
+    )
+
+    if status != 200:
+        return await render_template('error.html', error=response.get('message', 'Failed to retrieve transaction'))
+
+    return await render_template('transaction_details.html', transaction=response)
+
+@app.route('/profile')
+@login_required
+async def profile():
+    """User profile page"""
+    return await render_template('profile.html')
+
+@app.route('/profile/update', methods=['POST'])
+@login_required
+async def update_profile():
+    """Update user profile"""
+    form = await request.form
+    data = {'email': form.get('email')}
+    if form.get('password'):
+        data['password'] = form.get('password')
+
+    response, status = await make_service_request(
+        AUTH_SERVICE_URL,
+        '/api/auth/update_profile',
+        method='POST',
+        data=data
+    )
+
+    if status != 200:
+        return await render_template('profile.html', error=response.get('message', 'Failed to update profile'))
+
+    # Pick up the new email on the next request
+    session.pop('user_data', None)
+    return redirect(url_for('profile'))
+
+@app.route('/settings')
+@login_required
+async def settings():
+    """User settings page"""
+    user_settings = {
+        'email_notifications': True,
+        'login_alerts': True,
+        'transaction_notifications': True,
+        'theme': 'dark',
+        'default_view': 'dashboard',
+        'two_factor_auth': False
+    }
+
+    return await render_template('settings.html', settings=user_settings)
+
+@app.route('/settings/update', methods=['POST'])
+@login_required
+async def update_settings():
+    """Update user settings; like main.py, they are only kept in the session"""
+    form = await request.form
+    session['user_settings'] = {
+        'email_notifications': 'email_notifications' in form,
+        'login_alerts': 'login_alerts' in form,
+        'transaction_notifications': 'transaction_notifications' in form,
+        'theme': form.get('theme', 'dark'),
+        'default_view': form.get('default_view', 'dashboard'),
+        'two_factor_auth': 'two_factor_auth' in form
+    }
+
+    return await render_template(
+        'settings.html',
+        settings=session['user_settings'],
+        success='Settings updated successfully'
+    )
+
+async def money_movement(template, endpoint, data, failure_message):
+    """Submit a transfer, deposit or withdrawal; on failure re-render the form with the error"""
+    response, status = await make_service_request(
+        TRANSACTION_SERVICE_URL,
+        endpoint,
+        method='POST',
+        data=data
+    )
+
+    if status != 201:
+        return await render_template(
+            template,
+            error=response.get('message', failure_message),
+            accounts=await list_accounts()
+        )
+
+    return redirect(url_for('transactions'))
+
+@app.route('/transactions/transfer', methods=['GET', 'POST'])
+@login_required
+async def transfer():
+    if request.method == 'POST':
+        form = await request.form
+        from_account_id = form.get('from_account_id')
+        to_account_id = form.get('to_account_id')
+        amount = form.get('amount')
+
+        if not from_account_id or not to_account_id or not amount:
+            return await render_template('transfer.html', error='All fields are required')
+
+        return await money_movement('transfer.html', '/api/transactions/transfer', {
+            'from_account_id': from_account_id,
+            'to_account_id': to_account_id,
+            'amount': float(amount),
+            'description': form.get('description', '')
+        }, 'Failed to process transfer')
+
+    return await render_template('transfer.html', accounts=await list_accounts())
+
+@app.route('/transactions/deposit', methods=['GET', 'POST'])
+@login_required
+async def deposit():
+    if request.method == 'POST':
+        form = await request.form
+        account_id = form.get('account_id')
+        amount = form.get('amount')
+
+        if not account_id or not amount:
+            return await render_template('deposit.html', error='All fields are required')
+
+        return await money_movement('deposit.html', '/api/transactions/deposit', {
+            'account_id': account_id,
+            'amount': float(amount),
+            'description': form.get('description', 'Deposit')
+        }, 'Failed to process deposit')
+
+    return await render_template('deposit.html', accounts=await list_accounts())
+
+@app.route('/transactions/withdraw', methods=['GET', 'POST'])
+@login_required
+async def withdraw():
+    if request.method == 'POST':
+        form = await request.form
+        account_id = form.get('account_id')
+        amount = form.get('amount')
+
+        if not account_id or not amount:
+            return await render_template('withdraw.html', error='All fields are required')
+
+        return await money_movement('withdraw.html', '/api/transactions/withdraw', {
+            'account_id': account_id,
+            'amount': float(amount),
+            'description': form.get('description', 'Withdrawal')
+        }, 'Failed to process withdrawal')
+
+    return await render_template('withdraw.html', accounts=await list_accounts())
+
+@app.route('/reports')
+@login_required
+async def reports():
+    response, status = await make_service_request(
+        REPORTING_SERVICE_URL,
+        '/api/reports/list'
+    )
+
+    reports = response.get('reports', []) if status == 200 else []
+
+    return await render_template('reports.html', reports=reports)
+
+@app.route('/reports/account/<account_id>')
+@login_required
+async def account_report(account_id):
+    (response, status), (account_response, account_status) = await asyncio.gather(
+        make_service_request(REPORTING_SERVICE_URL, f'/api/reports/account/{account_id}'),
+        make_service_request(ACCOUNT_SERVICE_URL, f'/api/accounts/details/{account_id}'),
+    )
+
+    if status != 200:
+        return await render_template('error.html', error=response.get('message', 'Failed to generate report'))
+
+    account = account_response if account_status == 200 else {}
+
+    return await render_template('report_details.html', report=response.get('report'), account=account)
+
+@app.route('/reports/transactions')
+@login_required
+async def transaction_report():
+    params = {k: v for k, v in request.args.items() if k in ('start_date', 'end_date') and v}
+
+    response, status = await make_service_request(
+        REPORTING_SERVICE_URL,
+        '/api/reports/transactions',
+        params=params
+    )
+
+    if status != 200:
+        return await render_template('error.html', error=response.get('message', 'Failed to generate report'))
+
+    return await render_template('report_details.html', report=response.get('report'))
+
+@app.route('/reports/timeseries')
+@login_required
+async def timeseries_report():
+    """Cash-flow time series for dashboard charts (JSON)"""
+    params = {k: v for k, v in request.args.items() if k in ('account_id', 'interval', 'start_date', 'end_date')}
+
+    response, status = await make_service_request(
+        REPORTING_SERVICE_URL,
+        '/api/reports/timeseries',
+        params=params
+    )
+
+    return jsonify(response), status
+
+@app.route('/admin')
+@login_required
+async def admin_dashboard():
+    response, status = await make_service_request(
+        AUTH_SERVICE_URL,
+        '/api/auth/verify_admin'
+    )
+
+    if status != 200 or not response.get('is_admin', False):
+        return await render_template('error.html', error='Admin access required')
+
+    # Store admin role in session
+    session['role'] = 'admin'
+
+    # Users, one page of accounts (filtered server-side) and the system report, fetched concurrently
+    account_filters = {k: v for k, v in request.args.items() if k in ('status', 'account_type') and v}
+    (
+        (users_response, users_status),
+        (accounts_response, accounts_status),
+        (report_response, report_status),
+    ) = await asyncio.gather(
+        make_service_request(AUTH_SERVICE_URL, '/api/auth/users'),
+        make_service_request(
+            ACCOUNT_SERVICE_URL,
+            '/api/accounts/all',
+            params=dict(account_filters, page=request.args.get('page', 1, type=int), per_page=ADMIN_ACCOUNTS_PER_PAGE)
+        ),
+        make_service_request(REPORTING_SERVICE_URL, '/api/reports/system'),
+    )
+
+    if users_status != 200:
+        logger.error(f"Failed to get users: {users_response}")
+    if accounts_status != 200:
+        logger.error(f"Failed to get accounts: {accounts_response}")
+    if report_status != 200:
+        logger.error(f"Failed to get system report: {report_response}")
+
+    users = users_response.get('users', []) if users_status == 200 else []
+    accounts = accounts_response.get('accounts', []) if accounts_status == 200 else []
+    pagination = accounts_response.get('pagination', {}) if accounts_status == 200 else {}
+
+    # Extract report_data if it exists (nested structure from Report model)
+    report = {}
+    if report_status == 200 and 'report' in report_response:
+        report = report_response.get('report', {})
+        if 'report_data' in report:
+            report = report['report_data']
+
+    # Account counts come with the system report; without it, ask the account service directly
+    account_stats = report.get('system_stats')
+    if not account_stats:
+        stats_response, stats_status = await make_service_request(ACCOUNT_SERVICE_URL, '/api/accounts/stats')
+        account_stats = stats_response if stats_status == 200 else {}
+
+    return await render_template(
+        'admin.html',
+        users=users,
+        accounts=accounts,
+        pagination=pagination,
+        account_filters=account_filters,
+        report=report,
+        account_stats=account_stats
+    )
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint; the services are checked concurrently"""
+    (_, auth_status), (_, account_status), (_, transaction_status), (_, reporting_status) = await asyncio.gather(
+        make_service_request(AUTH_SERVICE_URL, '/api/health'),
+        make_service_request(ACCOUNT_SERVICE_URL, '/api/health'),
+        make_service_request(TRANSACTION_SERVICE_URL, '/api/health'),
+        make_service_request(REPORTING_SERVICE_URL, '/api/health'),
+    )
+
+    all_healthy = all(status == 200 for status in [auth_status, account_status, transaction_status, reporting_status])
+
+    return jsonify({
+        'status': 'healthy' if all_healthy else 'degraded',
+        'services': {
+            'api-gateway': 'healthy',
+            'auth-service': 'healthy' if auth_status == 200 else 'unhealthy',
+            'account-service': 'healthy' if account_status == 200 else 'unhealthy',
+            'transaction-service': 'healthy' if transaction_status == 200 else 'unhealthy',
+            'reporting-service': 'healthy' if reporting_status == 200 else 'unhealthy'
+        }
+    }), 200 if all_healthy else 503
+
+# Error handlers
+@app.errorhandler(404)
+async def page_not_found(e):
+    return await render_template('error.html', error='Page not found'), 404
+
+@app.errorhandler(500)
+async def server_error(e):
+    return await render_template('error.html', error='Server error'), 500
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=ASYNC_GATEWAY_PORT)
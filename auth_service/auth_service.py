@@ -1,88 +1,27 @@
 import os
-import consul
 import logging
 import jwt
+import http_responses
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 from flask import Flask, request, jsonify
 from auth_service.auth_models import db, User
+from event_bus import EventBus
+from service_registry import register_in_background
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-import os
-import consul
-
-# Consul configuration
-CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
-CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
 SERVICE_NAME = "auth-service"
-SERVICE_ID = f"{SERVICE_NAME}-{os.urandom(8).hex()}"
-SERVICE_PORT = 8001
-
-# Initialize Consul client
-consul_client = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-
-# Register service with Consul
-def register_service():
-    consul_client.agent.service.register(
-        name=SERVICE_NAME,
-        service_id=SERVICE_ID,
-        address="localhost",
-        port=SERVICE_PORT,
-        check=consul.Check.http(
-            f"http://localhost:{SERVICE_PORT}/api/health",
-            interval="10s",
-            timeout="5s",
-        ),
-    )
-    logger.info(f"Registered service with Consul as {SERVICE_ID}")
-
-# Deregister service from Consul
-def deregister_service():
-    consul_client.agent.service.deregister(SERVICE_ID)
-    logger.info(f"Deregistered service from Consul: {SERVICE_ID}")
-
-# Initialize Flask app
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("AUTH_DATABASE_URL")
-app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "auth_service_secret_key")
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
-
-# Initialize extensions
-db.init_app(app)
-
-# Create tables
-with app.app_context():
-    db.create_all()
-# Register service on startup
-with app.app_context():
-    register_service()
-
-# Deregister service on shutdown
-import atexit
-atexit.register(deregister_service)
-
-import os
-import consul
-import logging
-import jwt
-from datetime import datetime, timedelta, timezone
-from functools import wraps
-from flask import Flask, request, jsonify
-from werkzeug.security import generate_password_hash
-
-import logging
-
-import logging
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+# Address this instance listens on and registers in the service registry; give each instance
+# its own (a host or IP other services can reach) when running several
+SERVICE_HOST = os.environ.get("AUTH_SERVICE_HOST", "localhost")
+SERVICE_PORT = int(os.environ.get("AUTH_SERVICE_PORT", 8001))
 
 # Initialize Flask app
 app = Flask(__name__)
+http_responses.init_app(app)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("AUTH_DATABASE_URL")
 app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "auth_service_secret_key")
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
@@ -90,9 +29,8 @@ app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
 # Initialize extensions
 db.init_app(app)
 
-# Create tables
-with app.app_context():
-    db.create_all()
+# Cross-service change notifications
+event_bus = EventBus(SERVICE_NAME)
 
 # Helper functions
 def generate_token(user_id, username, role):
@@ -308,11 +246,19 @@ def update_user(current_user, user_id):
         allowed_fields = ['email', 'role', 'status']
         updates = {k: v for k, v in data.items() if k in allowed_fields}
         
+        previous_role, previous_status = user.role, user.status
+        
         for key, value in updates.items():
             setattr(user, key, value)
         
         db.session.commit()
         
+        # Let other services drop anything they cached for this user
+        if user.role != previous_role:
+            event_bus.publish('user.role_changed', {'user_id': user.id, 'role': user.role})
+        if user.status != previous_status and user.status != 'active':
+            event_bus.publish('user.disabled', {'user_id': user.id, 'status': user.status})
+        
         return jsonify({
             'message': 'User updated successfully',
             'user': user.to_dict()
@@ -332,6 +278,8 @@ def delete_user(current_user, user_id):
         db.session.delete(user)
         db.session.commit()
         
+        event_bus.publish('user.deleted', {'user_id': user_id})
+        
         return jsonify({'message': 'User deleted successfully'}), 200
 
 def create_default_admin():
@@ -349,8 +297,23 @@ def create_default_admin():
             db.session.commit()
             logger.info("Created default admin user")
 
-# Create default admin user
-create_default_admin()
+# Startup runs once per process, whichever entry point asks for the app first
+started = False
+
+def create_app():
+    """Run the service's startup tasks once and return the app.
+    Importing this module performs no database or network I/O; servers call this instead."""
+    global started
+    if started:
+        return app
+    started = True
+    
+    with app.app_context():
+        db.create_all()
+    create_default_admin()
+    event_bus.start()
+    register_in_background(SERVICE_NAME, SERVICE_PORT, address=SERVICE_HOST)
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True, host='localhost', port=8001)
\ No newline at end of file
+    create_app().run(debug=True, host=SERVICE_HOST, port=SERVICE_PORT)
\ No newline at end of file
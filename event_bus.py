@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import fnmatch
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Shared SQLite file every service publishes to and polls; empty keeps events in-process
+EVENT_BUS_PATH = os.environ.get("EVENT_BUS_PATH", "events.db")
+EVENT_BUS_POLL_INTERVAL = float(os.environ.get("EVENT_BUS_POLL_INTERVAL", 0.5))
+# How long published events are kept before they are pruned (seconds)
+EVENT_BUS_RETENTION = float(os.environ.get("EVENT_BUS_RETENTION", 3600))
+
+class EventBus:
+    """Lightweight publish/subscribe bus used to keep service caches coherent.
+
+    Events are appended to a table in a shared SQLite file and every started
+    process polls it for rows newer than the last one it has seen. Delivery is
+    best effort: subscribers only see events published after start(), which is
+    enough for invalidating in-memory caches. A durable bus instead stores its
+    position in the file and resumes from it on restart, so events published
+    while the service was down are still delivered; pruning keeps events a
+    durable consumer has not reached yet. Nothing touches the file until the
+    bus is first used.
+    """
+
+    def __init__(self, source, path=EVENT_BUS_PATH, poll_interval=EVENT_BUS_POLL_INTERVAL,
+                 retention=EVENT_BUS_RETENTION, durable=False):
+        """Initialize the bus for the named publishing service"""
+        self.source = source
+        self.durable = durable
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._handlers = []  # (topic pattern, handler)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._poller = None
+        self._ready = False
+        self._last_id = 0
+        self._last_prune = 0
+
+        # Threads and SQLite connections do not survive fork (e.g. gunicorn --preload workers)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _ensure_table(self):
+        """Create the events table on first use; returns False if the shared file is unusable"""
+        if self._ready or not self.path:
+            return self._ready
+
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS events ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "topic TEXT NOT NULL, "
+                    "source TEXT, "
+                    "payload TEXT NOT NULL, "
+                    "published_at REAL NOT NULL)"
+                )
+                # Positions of durable consumers, by source name
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS consumers ("
+                    "name TEXT PRIMARY KEY, "
+                    "last_id INTEGER NOT NULL)"
+                )
+            self._ready = True
+        except sqlite3.Error as e:
+            logger.warning(f"Event bus at {self.path} unavailable, using in-process delivery: {e}")
+            self.path = None
+        return self._ready
+
+    def _connect(self):
+        """Get this thread's connection to the shared events file"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def is_shared(self):
+        """Check whether events reach other processes through the shared file"""
+        return self._ensure_table()
+
+    def publish(self, topic, payload):
+        """Publish an event; failures are logged and never raised to the caller"""
+        if not self._ensure_table():
+            self._dispatch(topic, payload)
+            return
+
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO events (topic, source, payload, published_at) VALUES (?, ?, ?, ?)",
+                    (topic, self.source, json.dumps(payload), time.time())
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to publish {topic}: {e}")
+
+    def subscribe(self, topic, handler):
+        """Call handler(topic, payload) for events matching topic ('account.*' style patterns allowed)"""
+        with self._lock:
+            self._handlers.append((topic, handler))
+
+    def start(self):
+        """Start delivering events published by other processes to this process's subscribers"""
+        with self._lock:
+            if self._poller is not None or not self._handlers or not self._ensure_table():
+                return
+            with self._connect() as conn:
+                row = None
+                if self.durable:
+                    row = conn.execute("SELECT last_id FROM consumers WHERE name = ?", (self.source,)).fetchone()
+                if row is not None:
+                    self._last_id = row[0]
+                else:
+                    self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            self._save_position()
+            self._start_poller()
+
+    def _save_position(self):
+        """Store a durable consumer's position; workers sharing a name only ever move it forward"""
+        if not self.durable:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO consumers (name, last_id) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                (self.source, self._last_id)
+            )
+
+    def _start_poller(self):
+        """Start the background thread polling for new events"""
+        self._poller = threading.Thread(target=self._poll, name='event-bus-poller', daemon=True)
+        self._poller.start()
+
+    def _after_fork(self):
+        """Give a forked child its own lock, connections and poller, resuming from the parent's position"""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self._poller is not None:
+            self._start_poller()
+
+    def _dispatch(self, topic, payload):
+        """Hand an event to every matching handler"""
+        with self._lock:
+            handlers = [handler for pattern, handler in self._handlers if fnmatch.fnmatchcase(topic, pattern)]
+
+        for handler in handlers:
+            try:
+                handler(topic, payload)
+            except Exception as e:
+                logger.error(f"Event handler for {topic} failed: {e}")
+
+    def poll_once(self, limit=500):
+        """Deliver events published since the last poll; returns the number delivered"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, topic, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (self._last_id, limit)
+            ).fetchall()
+
+        for event_id, topic, payload in rows:
+            self._last_id = event_id
+            self._dispatch(topic, json.loads(payload))
+
+        if rows:
+            self._save_position()
+        return len(rows)
+
+    def prune(self):
+        """Delete events older than the retention period that every durable consumer has seen"""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM events WHERE published_at < ? "
+                "AND id <= COALESCE((SELECT MIN(last_id) FROM consumers), id)",
+                (time.time() - self.retention,)
+            )
+        self._last_prune = time.monotonic()
+
+    def _poll(self):
+        """Background loop delivering events to this process's subscribers"""
+        while True:
+            try:
+                # Keep draining while there is a backlog
+                while self.poll_once() > 0:
+                    pass
+                if time.monotonic() - self._last_prune > 60:
+                    self.prune()
+            except sqlite3.Error as e:
+                logger.warning(f"Event bus poll failed: {e}")
+            time.sleep(self.poll_interval)
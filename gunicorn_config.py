@@ -0,0 +1,30 @@
+"""
+Gunicorn settings shared by all services when launched with run_services.py --mode gunicorn
+"""
+
+import os
+
+# Time workers get to finish in-flight requests on reload or shutdown (seconds)
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers periodically so slow leaks cannot accumulate
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+accesslog = "-"
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the preloaded master so each worker opens its own"""
+    wsgi_app = server.app.wsgi()
+    # The monolith dispatches to several Flask apps
+    apps = [wsgi_app.app, *wsgi_app.mounts.values()] if hasattr(wsgi_app, 'mounts') else [wsgi_app]
+    
+    for app in apps:
+        db = app.extensions.get('sqlalchemy')
+        if db is None:
+            continue
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
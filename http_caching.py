@@ -0,0 +1,100 @@
+import os
+import hashlib
+import logging
+import threading
+from datetime import timezone
+import requests
+from flask import request, jsonify, Response
+import service_client
+
+logger = logging.getLogger(__name__)
+
+# How long clients may reuse a response that can never change, without revalidating (seconds)
+HTTP_CACHE_MAX_AGE = int(os.environ.get("HTTP_CACHE_MAX_AGE", 300))
+# Responses with an ETag the gateway keeps for revalidation (per process)
+GATEWAY_VALIDATOR_CACHE_SIZE = int(os.environ.get("GATEWAY_VALIDATOR_CACHE_SIZE", 1000))
+
+def etag_for(*parts):
+    """Strong ETag derived from the given values"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def utc(last_modified):
+    """Naive UTC datetime as an aware one at HTTP (whole second) precision"""
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+def is_not_modified(etag, last_modified=None):
+    """Check whether the request's If-None-Match (or, without one, If-Modified-Since) shows the
+    client already has this version"""
+    if request.if_none_match:
+        # Weak comparison, so a compressed response's weakened ETag still matches (see http_responses)
+        return request.if_none_match.contains_weak(etag)
+    return (last_modified is not None and request.if_modified_since is not None
+            and utc(last_modified) <= request.if_modified_since)
+
+def conditional_json(etag, build, last_modified=None, immutable=False):
+    """JSON response validated by etag (and last_modified, a naive UTC datetime).
+
+    A request that already has this version (see is_not_modified) gets an
+    empty 304, and build() is never called.
+    Immutable responses may be reused for HTTP_CACHE_MAX_AGE; others must be
+    revalidated every time. Callers check access before calling this.
+    """
+    response = Response(status=304) if is_not_modified(etag, last_modified) else jsonify(build())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = utc(last_modified)
+    # Every response is specific to the caller's token
+    response.headers['Cache-Control'] = f'private, max-age={HTTP_CACHE_MAX_AGE}' if immutable else 'private, no-cache'
+    return response
+
+class ValidatorCache:
+    """Responses carrying an ETag, kept so repeat GETs can be revalidated instead of re-fetched"""
+
+    def __init__(self, max_entries=GATEWAY_VALIDATOR_CACHE_SIZE):
+        """Initialize an empty cache"""
+        self.max_entries = max_entries
+        self._entries = {}  # (full URL, Authorization) -> requests.Response
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the cached response for a key, or None"""
+        with self._lock:
+            response = self._entries.pop(key, None)
+            if response is not None:
+                # Re-inserting keeps the dict ordered from least to most recently used
+                self._entries[key] = response
+            return response
+
+    def store(self, key, response):
+        """Cache a response"""
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = response
+
+    def discard(self, key):
+        """Drop a cached response"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+validators = ValidatorCache()
+
+def get(url, params=None, headers=None):
+    """Make an inter-service GET, revalidating a previously seen response with If-None-Match.
+    On 304 the cached response is returned, so callers always see a full 200 response."""
+    key = (requests.Request('GET', url, params=params).prepare().url, (headers or {}).get('Authorization'))
+    cached = validators.get(key)
+    request_headers = dict(headers or {})
+    if cached is not None:
+        request_headers['If-None-Match'] = cached.headers['ETag']
+
+    response = service_client.get(url, params=params, headers=request_headers)
+
+    if response.status_code == 304 and cached is not None:
+        return cached
+    if response.status_code == 200 and 'ETag' in response.headers:
+        validators.store(key, response)
+    else:
+        validators.discard(key)
+    return response
@@ -0,0 +1,88 @@
+import os
+import gzip
+import logging
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compress responses of at least this many bytes when the client accepts it; 0 disables compression
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 6))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider encoding with orjson; output matches the default provider's (sorted keys,
+    dates as HTTP dates) without the stdlib encoder's per-object overhead"""
+
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string"""
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        """Serialize obj to JSON bytes; types orjson does not know go through the default provider's hook"""
+        return orjson.dumps(obj, default=self.default, option=self.options)
+
+    def loads(self, s, **kwargs):
+        """Deserialize JSON"""
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """JSON response built from bytes, skipping the str round trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+def negotiate_encoding():
+    """Pick the best content encoding the client accepts, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    """Compress a sufficiently large text or JSON response with gzip or brotli"""
+    if (not COMPRESSION_MIN_SIZE
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=min(COMPRESSION_LEVEL, 11)))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=COMPRESSION_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+
+    # The compressed bytes are a different representation of the same resource
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_app(app):
+    """Use the fast JSON provider (when orjson is installed) and response compression for an app"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.after_request(compress_response)
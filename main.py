@@ -1,7 +1,15 @@
 import os
 import json
+import time
 import logging
 import requests
+import service_client
+import single_flight
+import http_responses
+import template_cache
+from session_store import session_interface
+from datetime import datetime
+from functools import lru_cache
 from flask import Flask, request, jsonify, session, redirect, url_for, render_template
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 
@@ -11,7 +19,11 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+http_responses.init_app(app)
+template_cache.init_app(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "api_gateway_secret_key")
+# Session data is kept server-side (see SESSION_STORE); the cookie only holds an id
+app.session_interface = session_interface()
 app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "api_gateway_secret_key")
 
 # Initialize Flask-Login
@@ -20,15 +32,14 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # Custom Jinja filters
-@app.template_filter('format_date')
-def format_date(value, format='%Y-%m-%d %H:%M:%S'):
+@lru_cache(maxsize=4096)
+def _format_date(value, format):
     """Format a date time to a readable format"""
     if not value:
         return ''
     if isinstance(value, str):
         # Try to parse the string
         try:
-            from datetime import datetime
             if 'T' in value:
                 value = datetime.fromisoformat(value.replace('Z', '+00:00'))
             else:
@@ -41,12 +52,30 @@ def format_date(value, format='%Y-%m-%d %H:%M:%S'):
     except:
         return value
 
+@app.template_filter('format_date')
+def format_date(value, format='%Y-%m-%d %H:%M:%S'):
+    """Format a date time to a readable format; the same timestamps repeat across
+    dashboard, accounts and admin pages, so results are memoized"""
+    try:
+        return _format_date(value, format)
+    except TypeError:
+        # Unhashable value
+        return _format_date.__wrapped__(value, format)
+
 # Service URLs - now using environment variables for service discovery
 AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
 ACCOUNT_SERVICE_URL = os.environ.get("ACCOUNT_SERVICE_URL", "http://localhost:8002")
 TRANSACTION_SERVICE_URL = os.environ.get("TRANSACTION_SERVICE_URL", "http://localhost:8003")
 REPORTING_SERVICE_URL = os.environ.get("REPORTING_SERVICE_URL", "http://localhost:8004")
 
+# How long a verified user in the session is trusted before the token is checked again (seconds)
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 30))
+# How long a verified user stays logged in while the auth service cannot be reached (seconds)
+PROFILE_OUTAGE_GRACE = float(os.environ.get("PROFILE_OUTAGE_GRACE", 5 * PROFILE_CACHE_TTL))
+
+# Accounts shown per page on the admin dashboard
+ADMIN_ACCOUNTS_PER_PAGE = int(os.environ.get("ADMIN_ACCOUNTS_PER_PAGE", 25))
+
 # Define User class for Flask-Login
 class User:
     def __init__(self, user_data, token):
@@ -62,24 +91,43 @@ class User:
     def get_id(self):
         return self.id
 
+def verified_user_data(session, max_age):
+    """The user data cached in a session if its token was verified within max_age seconds, else None"""
+    user_data = session.get('user_data')
+    if user_data and time.time() - session.get('user_verified_at', 0) < max_age:
+        return user_data
+    return None
+
 # Flask-Login user loader
 @login_manager.user_loader
 def load_user(user_id):
+    """Load the logged-in user from the session, verifying the token at most once per PROFILE_CACHE_TTL"""
     if 'token' not in session:
         return None
 
+    user_data = verified_user_data(session, PROFILE_CACHE_TTL)
+    if user_data:
+        return User(user_data, session['token'])
+
     try:
-        response = requests.get(
+        response = single_flight.get(
             f"{AUTH_SERVICE_URL}/api/auth/verify_token",
             headers={'Authorization': f'Bearer {session["token"]}'}
         )
 
         if response.ok:
-            user_data = response.json()
-            return User(user_data, session["token"])
+            session['user_data'] = response.json()
+            session['user_verified_at'] = time.time()
+            return User(session['user_data'], session["token"])
+
+        session.pop('user_data', None)
 
     except requests.RequestException:
         logger.error("Failed to verify token with auth service")
+        # Keep users logged in through a brief auth service outage
+        user_data = verified_user_data(session, PROFILE_OUTAGE_GRACE)
+        if user_data:
+            return User(user_data, session['token'])
 
     return None
 
@@ -96,13 +144,13 @@ def make_service_request(service_url, endpoint, method='GET', data=None, params=
 
     try:
         if method == 'GET':
-            response = requests.get(url, params=params, headers=headers)
+            response = single_flight.get(url, params=params, headers=headers)
         elif method == 'POST':
-            response = requests.post(url, json=data, headers=headers)
+            response = service_client.post(url, json=data, headers=headers)
         elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers)
+            response = service_client.put(url, json=data, headers=headers)
         elif method == 'DELETE':
-            response = requests.delete(url, headers=headers)
+            response = service_client.delete(url, headers=headers)
         else:
             return {'error': 'Unsupported HTTP method'}, 400
 
@@ -145,6 +193,7 @@ def login():
 
         # Create user object and login
         user = User(response, response['token'])
+        session.regenerate()
         login_user(user)
         session['token'] = response['token']
 
@@ -157,6 +206,7 @@ def login():
 def logout():
     logout_user()
     session.pop('token', None)
+    session.pop('user_data', None)
     return redirect(url_for('index'))
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -350,6 +400,8 @@ def update_profile():
     if status != 200:
         return render_template('profile.html', error=response.get('message', 'Failed to update profile'))
     
+    # Pick up the new email on the next request
+    session.pop('user_data', None)
     return redirect(url_for('profile'))
 
 @app.route('/settings')
@@ -622,6 +674,20 @@ def transaction_report():
 
     return render_template('report_details.html', report=report)
 
+@app.route('/reports/timeseries')
+@login_required
+def timeseries_report():
+    """Cash-flow time series for dashboard charts (JSON)"""
+    params = {k: v for k, v in request.args.items() if k in ('account_id', 'interval', 'start_date', 'end_date')}
+
+    response, status = make_service_request(
+        REPORTING_SERVICE_URL,
+        '/api/reports/timeseries',
+        params=params
+    )
+
+    return jsonify(response), status
+
 @app.route('/admin')
 @login_required
 def admin_dashboard():
@@ -647,10 +713,12 @@ def admin_dashboard():
         if users_status != 200:
             logger.error(f"Failed to get users: {users_response}")
         
-        # Get all accounts
+        # Get one page of accounts, filtered server-side
+        account_filters = {k: v for k, v in request.args.items() if k in ('status', 'account_type') and v}
         accounts_response, accounts_status = make_service_request(
             ACCOUNT_SERVICE_URL,
-            '/api/accounts/all'
+            '/api/accounts/all',
+            params=dict(account_filters, page=request.args.get('page', 1, type=int), per_page=ADMIN_ACCOUNTS_PER_PAGE)
         )
         
         if accounts_status != 200:
@@ -668,6 +736,7 @@ def admin_dashboard():
         # Use data from responses
         users = users_response.get('users', []) if users_status == 200 else []
         accounts = accounts_response.get('accounts', []) if accounts_status == 200 else []
+        pagination = accounts_response.get('pagination', {}) if accounts_status == 200 else {}
         
         # Extract the report data directly
         report = {}
@@ -677,11 +746,20 @@ def admin_dashboard():
             if 'report_data' in report:
                 report = report['report_data']
         
+        # Account counts come with the system report; without it, ask the account service directly
+        account_stats = report.get('system_stats')
+        if not account_stats:
+            stats_response, stats_status = make_service_request(ACCOUNT_SERVICE_URL, '/api/accounts/stats')
+            account_stats = stats_response if stats_status == 200 else {}
+        
         return render_template(
             'admin.html',
             users=users,
             accounts=accounts,
-            report=report
+            pagination=pagination,
+            account_filters=account_filters,
+            report=report,
+            account_stats=account_stats
         )
         
     except Exception as e:
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Monolith Mode - Serves the API gateway and every service from a single process
+"""
+
+import os
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.serving import run_simple
+
+import service_client
+from auth_service import auth_service
+from account_service import account_service
+from transaction_service import transaction_service
+from reporting_service import reporting_service
+from main import (
+    app as gateway_app,
+    AUTH_SERVICE_URL,
+    ACCOUNT_SERVICE_URL,
+    TRANSACTION_SERVICE_URL,
+    REPORTING_SERVICE_URL,
+)
+
+MONOLITH_PORT = int(os.environ.get("MONOLITH_PORT", 5000))
+
+auth_app = auth_service.create_app()
+account_app = account_service.create_app()
+transaction_app = transaction_service.create_app()
+reporting_app = reporting_service.create_app()
+
+# Calls to the configured service URLs become in-process calls instead of HTTP requests
+for service_url, service_app in (
+    (AUTH_SERVICE_URL, auth_app),
+    (ACCOUNT_SERVICE_URL, account_app),
+    (TRANSACTION_SERVICE_URL, transaction_app),
+    (REPORTING_SERVICE_URL, reporting_app),
+):
+    service_client.mount_in_process(service_url, service_app)
+
+# The gateway serves the web UI at the root; each service API stays reachable under its own prefix
+app = DispatcherMiddleware(gateway_app, {
+    '/services/auth': auth_app,
+    '/services/account': account_app,
+    '/services/transaction': transaction_app,
+    '/services/reporting': reporting_app,
+})
+
+if __name__ == '__main__':
+    run_simple('0.0.0.0', MONOLITH_PORT, app, threaded=True)
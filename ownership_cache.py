@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+import threading
+import service_client
+
+logger = logging.getLogger(__name__)
+
+# How long a user's account list is trusted before it is fetched again (seconds)
+OWNERSHIP_CACHE_TTL = float(os.environ.get("OWNERSHIP_CACHE_TTL", 60))
+OWNERSHIP_CACHE_MAX_USERS = int(os.environ.get("OWNERSHIP_CACHE_MAX_USERS", 10000))
+
+class OwnershipCache:
+    """Per-user cache of owned account ids, shared by services that check account access"""
+
+    def __init__(self, account_service_url, ttl=OWNERSHIP_CACHE_TTL, max_users=OWNERSHIP_CACHE_MAX_USERS):
+        """Initialize the cache for the given account service"""
+        self.account_service_url = account_service_url
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = {}  # user_id -> (expires_at, frozenset of account ids)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, token):
+        """Get the ids of the accounts owned by a user, loading them on a miss or expiry"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        return self.refresh(user_id, token)
+
+    def refresh(self, user_id, token):
+        """Load a user's account ids from the account service and cache them.
+        Raises requests.RequestException if the account service call fails."""
+        response = service_client.get(
+            f"{self.account_service_url}/api/accounts/list",
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        response.raise_for_status()
+
+        account_ids = frozenset(account['id'] for account in response.json().get('accounts', []))
+        self.store(user_id, account_ids)
+        return account_ids
+
+    def store(self, user_id, account_ids):
+        """Cache a user's account ids"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if len(self._entries) >= self.max_users:
+                # Entries are kept in insertion order, so the first one is the oldest
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[user_id] = (time.monotonic() + self.ttl, frozenset(account_ids))
+
+    def owns_any(self, user_id, token, account_ids):
+        """Check whether a user owns any of the given accounts.
+
+        A negative answer is re-checked against fresh data once, so accounts
+        opened after the entry was cached are recognized immediately.
+        """
+        if self.get(user_id, token).intersection(account_ids):
+            return True
+        return bool(self.refresh(user_id, token).intersection(account_ids))
+
+    def note_owned(self, user_id, account_id):
+        """Record that a user owns an account; a cached entry missing it is dropped"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and account_id not in entry[1]:
+                del self._entries[user_id]
+
+    def invalidate(self, user_id=None):
+        """Drop the cached entry for a user, or every entry"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def listen(self, event_bus):
+        """Invalidate entries when accounts or users change elsewhere"""
+        def on_event(topic, payload):
+            user_id = payload.get('user_id')
+            if user_id is None:
+                # invalidate(None) would flush every user
+                logger.warning(f"Ignoring {topic} event without a user_id")
+                return
+            self.invalidate(user_id)
+
+        for topic in ('account.created', 'account.closed', 'user.*'):
+            event_bus.subscribe(topic, on_event)
@@ -1,11 +1,15 @@
 import os
 import uuid
 import json
+import zlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy import Column, String, DateTime, JSON
 
+# report_data payloads at least this large (bytes of JSON) are stored zlib-compressed
+REPORT_COMPRESSION_THRESHOLD = int(os.environ.get("REPORT_COMPRESSION_THRESHOLD", 1024))
+
 class Base(DeclarativeBase):
     pass
 
@@ -14,6 +18,10 @@ db = SQLAlchemy(model_class=Base)
 class Report(db.Model):
     """Report model for reporting service"""
     __tablename__ = 'reports'
+    __table_args__ = (
+        db.Index('ix_reports_user_created', 'user_id', 'created_at'),
+        db.Index('ix_reports_type_created', 'report_type', 'created_at'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), nullable=False, index=True)
@@ -21,9 +29,39 @@ class Report(db.Model):
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(255))
     parameters = db.Column(JSON, default={})
-    report_data = db.Column(JSON, default={})
+    _report_data = db.Column('report_data', JSON, default={})
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Large payloads are kept as a compressed blob instead, see the report_data property
+    report_blob = db.Column(db.LargeBinary)
+    data_encoding = db.Column(db.String(10))
+    data_size = db.Column(db.Integer)
+    stored_size = db.Column(db.Integer)
+    
+    @property
+    def report_data(self):
+        """Report payload, decompressed on access"""
+        if self.data_encoding == 'zlib':
+            return json.loads(zlib.decompress(self.report_blob))
+        return self._report_data
+    
+    @report_data.setter
+    def report_data(self, value):
+        """Store the report payload, compressing it when it exceeds the threshold"""
+        raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        self.data_size = len(raw)
+        
+        if len(raw) >= REPORT_COMPRESSION_THRESHOLD:
+            self.report_blob = zlib.compress(raw)
+            self._report_data = None
+            self.data_encoding = 'zlib'
+            self.stored_size = len(self.report_blob)
+        else:
+            self.report_blob = None
+            self._report_data = value
+            self.data_encoding = 'json'
+            self.stored_size = self.data_size
+    
     def to_dict(self):
         """Convert Report object to dictionary"""
         return {
@@ -34,5 +72,7 @@ class Report(db.Model):
             'description': self.description,
             'parameters': self.parameters,
             'report_data': self.report_data,
+            'data_size': self.data_size,
+            'stored_size': self.stored_size,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
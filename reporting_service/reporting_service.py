@@ -1,72 +1,87 @@
-import consul
 import os
 import logging
+import threading
+import time
 import requests
+import service_client
+import http_responses
 import jwt
 import json
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import Flask, request, jsonify
 from reporting_service.reporting_models import db, Report
+from ownership_cache import OwnershipCache
+from event_bus import EventBus
+from http_caching import conditional_json, etag_for
+from service_registry import register_in_background
+from schema_upgrade import add_missing_columns, create_missing_indexes
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+SERVICE_NAME = "reporting-service"
+# Address this instance listens on and registers in the service registry; give each instance
+# its own (a host or IP other services can reach) when running several
+SERVICE_HOST = os.environ.get("REPORTING_SERVICE_HOST", "localhost")
+SERVICE_PORT = int(os.environ.get("REPORTING_SERVICE_PORT", 8004))
+
 # Initialize Flask app
 app = Flask(__name__)
+http_responses.init_app(app)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("REPORTING_DATABASE_URL")
 app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "reporting_service_secret_key")
 
 # Initialize extensions
 db.init_app(app)
 
-# Create tables
-with app.app_context():
-    db.create_all()
+# Service URLs
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
+ACCOUNT_SERVICE_URL = os.environ.get("ACCOUNT_SERVICE_URL", "http://localhost:8002")
+TRANSACTION_SERVICE_URL = os.environ.get("TRANSACTION_SERVICE_URL", "http://localhost:8003")
 
-# Consul configuration
-CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
-CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
-SERVICE_NAME = "reporting-service"
-SERVICE_ID = f"{SERVICE_NAME}-{os.urandom(8).hex()}"
-SERVICE_PORT = 8004
-
-# Initialize Consul client
-consul_client = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-
-# Register service with Consul
-def register_service():
-    consul_client.agent.service.register(
-        name=SERVICE_NAME,
-        service_id=SERVICE_ID,
-        address="localhost",
-        port=SERVICE_PORT,
-        check=consul.Check.http(
-            f"http://localhost:{SERVICE_PORT}/api/health",
-            interval="10s",
-            timeout="5s",
-        ),
-    )
-    logger.info(f"Registered service with Consul as {SERVICE_ID}")
+# user_id -> owned account ids, used for access checks
+ownership_cache = OwnershipCache(ACCOUNT_SERVICE_URL)
 
-# Deregister service from Consul
-def deregister_service():
-    consul_client.agent.service.deregister(SERVICE_ID)
-    logger.info(f"Deregistered service from Consul: {SERVICE_ID}")
+# Cross-service change notifications
+event_bus = EventBus(SERVICE_NAME)
+ownership_cache.listen(event_bus)
 
-# Register service on startup
-with app.app_context():
-    register_service()
+# Bounded pool for concurrent calls to other services, and the deadline applied to them (seconds)
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", 10))
+upstream_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("UPSTREAM_MAX_WORKERS", 8)),
+    thread_name_prefix='upstream'
+)
 
-# Deregister service on shutdown
-import atexit
-atexit.register(deregister_service)
+# How account/transaction reports keep their transaction detail:
+#   embedded  - a full copy of every transaction is stored in report_data
+#   reference - only the summary and a reference to the transaction window is stored;
+#               details are fetched from the transaction service when the report is viewed
+REPORT_TRANSACTION_STORAGE = os.environ.get("REPORT_TRANSACTION_STORAGE", "embedded")
 
-# Service URLs
-AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
-ACCOUNT_SERVICE_URL = os.environ.get("ACCOUNT_SERVICE_URL", "http://localhost:8002")
-TRANSACTION_SERVICE_URL = os.environ.get("TRANSACTION_SERVICE_URL", "http://localhost:8003")
+# Retention policy per report type; REPORT_RETENTION_POLICY may override it with JSON of the same shape
+DEFAULT_RETENTION_POLICY = {
+    'account': {'max_age_days': 30, 'max_per_user': 50},
+    'transaction': {'max_age_days': 30, 'max_per_user': 50},
+    'system': {'max_age_days': 90, 'max_per_user': 100}
+}
+RETENTION_POLICY = json.loads(os.environ["REPORT_RETENTION_POLICY"]) if os.environ.get("REPORT_RETENTION_POLICY") else DEFAULT_RETENTION_POLICY
+RETENTION_INTERVAL = int(os.environ.get("REPORT_RETENTION_INTERVAL", 3600))  # seconds, 0 disables the purge job
+RETENTION_BATCH_SIZE = int(os.environ.get("REPORT_RETENTION_BATCH_SIZE", 500))
+
+# Purge metrics, exposed through /api/reports/retention
+retention_lock = threading.Lock()
+retention_stats = {
+    'runs': 0,
+    'last_run': None,
+    'last_duration_ms': None,
+    'last_purged': 0,
+    'purged_total': 0,
+    'purged_by_type': {}
+}
 
 # Helper functions
 def token_required(f):
@@ -84,7 +99,7 @@ def token_required(f):
         
         try:
             # Verify token with auth service
-            response = requests.get(
+            response = service_client.get(
                 f"{AUTH_SERVICE_URL}/api/auth/verify_token",
                 headers={'Authorization': f'Bearer {token}'}
             )
@@ -113,7 +128,7 @@ def admin_required(f):
         token = request.headers.get('Authorization').split(' ')[1]
         
         try:
-            response = requests.get(
+            response = service_client.get(
                 f"{AUTH_SERVICE_URL}/api/auth/verify_admin",
                 headers={'Authorization': f'Bearer {token}'}
             )
@@ -131,19 +146,10 @@ def admin_required(f):
 def parse_date(date_str):
     """Parse date string to datetime object"""
     try:
-        return datetime.strptime(date_str, '%Y-%m-%d')
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
     except ValueError:
         return None
 
-def filter_transactions_by_date(transactions, start_date, end_date):
-    """Filter transactions by date range"""
-    filtered = []
-    for transaction in transactions:
-        transaction_date = datetime.fromisoformat(transaction['timestamp'].replace('Z', '+00:00'))
-        if start_date <= transaction_date.date() <= end_date:
-            filtered.append(transaction)
-    return filtered
-
 def calculate_summary(transactions):
     """Calculate summary statistics for transactions"""
     summary = {
@@ -165,6 +171,182 @@ def calculate_summary(transactions):
     
     return summary
 
+def account_reference(account):
+    """Keep only the identifying fields of an account for referenced reports"""
+    return {
+        'id': account['id'],
+        'account_number': account['account_number'],
+        'account_type': account['account_type']
+    }
+
+def transaction_reference(account_ids, start_date, end_date, until, count):
+    """Reference to the transactions a report covers, used instead of embedding them"""
+    return {
+        'account_ids': account_ids,
+        'start_date': start_date,
+        'end_date': end_date,
+        'until': until,
+        'count': count
+    }
+
+def referenced_report_data(report_data, account_ids, until):
+    """Replace embedded transactions and account objects in report_data with references"""
+    stored = {k: v for k, v in report_data.items() if k != 'transactions'}
+    if 'account' in stored:
+        stored['account'] = account_reference(stored['account'])
+    if 'accounts' in stored:
+        stored['accounts'] = [account_reference(a) for a in stored['accounts']]
+    stored['transaction_ref'] = transaction_reference(
+        account_ids,
+        report_data['period']['start_date'],
+        report_data['period']['end_date'],
+        until.isoformat(),
+        len(report_data['transactions'])
+    )
+    return stored
+
+def store_report_data(report_data, account_ids, created_at):
+    """Return report_data in the form it should be persisted in"""
+    if REPORT_TRANSACTION_STORAGE == 'reference':
+        return referenced_report_data(report_data, account_ids, created_at)
+    return report_data
+
+def materialize_transactions(transaction_ref, token):
+    """Fetch the transactions described by a report's transaction reference"""
+    # Transactions created after the report was generated are not part of it
+    until = datetime.fromisoformat(transaction_ref['until'])
+    if until.date() <= parse_date(transaction_ref['end_date']):
+        end = until.isoformat()
+    else:
+        end = transaction_ref['end_date']
+    
+    transactions = {}
+    for account_id in transaction_ref['account_ids']:
+        response = service_client.get(
+            f"{TRANSACTION_SERVICE_URL}/api/transactions/account/{account_id}",
+            headers={'Authorization': f'Bearer {token}'},
+            params={'start': transaction_ref['start_date'], 'end': end}
+        )
+        response.raise_for_status()
+        
+        for transaction in response.json().get('transactions', []):
+            transactions[transaction['id']] = transaction
+    
+    return sorted(transactions.values(), key=lambda t: t['timestamp'], reverse=True)
+
+def compact_reports(batch_size=100):
+    """Convert reports with embedded transactions to the referenced form and compress
+    reports stored before compression existed, one batch per commit"""
+    compacted = 0
+    last_id = ''
+    
+    with app.app_context():
+        while True:
+            reports = Report.query.filter(
+                Report.id > last_id
+            ).order_by(Report.id).limit(batch_size).all()
+            
+            if not reports:
+                break
+            
+            for report in reports:
+                data = report.report_data or {}
+                
+                if 'transactions' in data and report.report_type in ['account', 'transaction']:
+                    if 'account' in data:
+                        account_ids = [data['account']['id']]
+                    else:
+                        account_ids = [a['id'] for a in data.get('accounts', [])]
+                    
+                    report.report_data = referenced_report_data(data, account_ids, report.created_at)
+                    compacted += 1
+                elif report.data_encoding is None:
+                    # Rewriting the payload records its size and compresses it if large enough
+                    report.report_data = data
+                    compacted += 1
+            
+            db.session.commit()
+            last_id = reports[-1].id
+    
+    logger.info(f"Compacted {compacted} reports")
+    return compacted
+
+def delete_in_batches(query, batch_size):
+    """Delete the reports matched by query in short transactions of at most batch_size rows"""
+    deleted = 0
+    while True:
+        ids = [row.id for row in query.with_entities(Report.id).limit(batch_size).all()]
+        if not ids:
+            return deleted
+        
+        Report.query.filter(Report.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+
+def purge_reports(batch_size=RETENTION_BATCH_SIZE):
+    """Enforce the retention policy: drop reports past their max age and each user's oldest
+    reports beyond the per-type limit"""
+    started = time.monotonic()
+    purged = {}
+    
+    with app.app_context():
+        for report_type, policy in RETENTION_POLICY.items():
+            count = 0
+            
+            if policy.get('max_age_days'):
+                cutoff = datetime.utcnow() - timedelta(days=policy['max_age_days'])
+                count += delete_in_batches(
+                    Report.query.filter(Report.report_type == report_type, Report.created_at < cutoff),
+                    batch_size
+                )
+            
+            max_per_user = policy.get('max_per_user')
+            if max_per_user:
+                over_limit = db.session.query(Report.user_id).filter(
+                    Report.report_type == report_type
+                ).group_by(Report.user_id).having(db.func.count(Report.id) > max_per_user).all()
+                
+                for (user_id,) in over_limit:
+                    count += delete_in_batches(
+                        Report.query.filter_by(user_id=user_id, report_type=report_type)
+                        .order_by(Report.created_at.desc()).offset(max_per_user),
+                        batch_size
+                    )
+            
+            purged[report_type] = count
+    
+    total = sum(purged.values())
+    with retention_lock:
+        retention_stats['runs'] += 1
+        retention_stats['last_run'] = datetime.utcnow().isoformat()
+        retention_stats['last_duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        retention_stats['last_purged'] = total
+        retention_stats['purged_total'] += total
+        for report_type, count in purged.items():
+            retention_stats['purged_by_type'][report_type] = retention_stats['purged_by_type'].get(report_type, 0) + count
+    
+    logger.info(f"Retention purge removed {total} reports: {purged}")
+    return purged
+
+def retention_worker(interval):
+    """Run the retention purge every interval seconds"""
+    while True:
+        time.sleep(interval)
+        try:
+            purge_reports()
+        except Exception as e:
+            logger.error(f"Retention purge failed: {e}")
+
+@app.cli.command('compact-reports')
+def compact_reports_command():
+    """Convert existing reports to referenced, compressed storage"""
+    print(f"Compacted {compact_reports()} reports")
+
+@app.cli.command('purge-reports')
+def purge_reports_command():
+    """Apply the report retention policy once"""
+    print(f"Purged reports: {purge_reports()}")
+
 # Routes
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -186,7 +368,7 @@ def account_report(current_user, account_id):
     # Verify account access
     try:
         token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
+        response = service_client.get(
             f"{ACCOUNT_SERVICE_URL}/api/accounts/details/{account_id}",
             headers={'Authorization': f'Bearer {token}'}
         )
@@ -201,22 +383,20 @@ def account_report(current_user, account_id):
     
     # Get transactions for this account
     try:
-        response = requests.get(
+        response = service_client.get(
             f"{TRANSACTION_SERVICE_URL}/api/transactions/account/{account_id}",
-            headers={'Authorization': f'Bearer {token}'}
+            headers={'Authorization': f'Bearer {token}'},
+            params={'start': start_date.isoformat(), 'end': end_date.isoformat()}
         )
         
         if not response.ok:
             return jsonify({'message': 'Failed to retrieve transactions'}), response.status_code
             
-        transactions = response.json().get('transactions', [])
+        filtered_transactions = response.json().get('transactions', [])
         
     except requests.RequestException:
         return jsonify({'message': 'Transaction service unavailable'}), 503
     
-    # Filter transactions by date
-    filtered_transactions = filter_transactions_by_date(transactions, start_date, end_date)
-    
     # Calculate summary statistics
     summary = calculate_summary(filtered_transactions)
     
@@ -233,6 +413,7 @@ def account_report(current_user, account_id):
     
     # Save report
     with app.app_context():
+        created_at = datetime.utcnow()
         report = Report(
             user_id=current_user['user_id'],
             report_type='account',
@@ -243,14 +424,18 @@ def account_report(current_user, account_id):
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat()
             },
-            report_data=report_data
+            report_data=store_report_data(report_data, [account_id], created_at),
+            created_at=created_at
         )
         
         db.session.add(report)
         db.session.commit()
         
+        # The freshly generated report is always returned with full detail
+        report_dict = report.to_dict()
+        report_dict['report_data'] = report_data
         return jsonify({
-            'report': report.to_dict()
+            'report': report_dict
         }), 200
 
 @app.route('/api/reports/transactions', methods=['GET'])
@@ -268,7 +453,7 @@ def transaction_report(current_user):
     # Get all accounts for the user
     try:
         token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
+        response = service_client.get(
             f"{ACCOUNT_SERVICE_URL}/api/accounts/list",
             headers={'Authorization': f'Bearer {token}'}
         )
@@ -283,22 +468,20 @@ def transaction_report(current_user):
     
     # Get all transactions for the user
     try:
-        response = requests.get(
+        response = service_client.get(
             f"{TRANSACTION_SERVICE_URL}/api/transactions/list",
-            headers={'Authorization': f'Bearer {token}'}
+            headers={'Authorization': f'Bearer {token}'},
+            params={'start': start_date.isoformat(), 'end': end_date.isoformat()}
         )
         
         if not response.ok:
             return jsonify({'message': 'Failed to retrieve transactions'}), response.status_code
             
-        transactions = response.json().get('transactions', [])
+        filtered_transactions = response.json().get('transactions', [])
         
     except requests.RequestException:
         return jsonify({'message': 'Transaction service unavailable'}), 503
     
-    # Filter transactions by date
-    filtered_transactions = filter_transactions_by_date(transactions, start_date, end_date)
-    
     # Calculate summary statistics
     summary = calculate_summary(filtered_transactions)
     
@@ -315,6 +498,7 @@ def transaction_report(current_user):
     
     # Save report
     with app.app_context():
+        created_at = datetime.utcnow()
         report = Report(
             user_id=current_user['user_id'],
             report_type='transaction',
@@ -324,14 +508,18 @@ def transaction_report(current_user):
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat()
             },
-            report_data=report_data
+            report_data=store_report_data(report_data, [a['id'] for a in accounts], created_at),
+            created_at=created_at
         )
         
         db.session.add(report)
         db.session.commit()
         
+        # The freshly generated report is always returned with full detail
+        report_dict = report.to_dict()
+        report_dict['report_data'] = report_data
         return jsonify({
-            'report': report.to_dict()
+            'report': report_dict
         }), 200
 
 @app.route('/api/reports/system', methods=['GET'])
@@ -346,80 +534,65 @@ def system_report(current_user):
     # Parse dates
     start_date = parse_date(start_date_str) if start_date_str else (datetime.now() - timedelta(days=30)).date()
     end_date = parse_date(end_date_str) if end_date_str else datetime.now().date()
+    if start_date is None or end_date is None:
+        return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
     
-    # Get all users
-    try:
-        token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
-            f"{AUTH_SERVICE_URL}/api/auth/users",
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        
-        if not response.ok:
-            return jsonify({'message': 'Failed to retrieve users'}), response.status_code
-            
-        users = response.json().get('users', [])
-        
-    except requests.RequestException:
-        return jsonify({'message': 'Auth service unavailable'}), 503
+    # Fetch users, account aggregates and the transactions in the report window concurrently
+    token = request.headers.get('Authorization').split(' ')[1]
+    headers = {'Authorization': f'Bearer {token}'}
+    upstreams = {
+        'users': ('Auth service', upstream_executor.submit(
+            service_client.get, f"{AUTH_SERVICE_URL}/api/auth/users",
+            headers=headers, timeout=UPSTREAM_TIMEOUT
+        )),
+        'account_stats': ('Account service', upstream_executor.submit(
+            service_client.get, f"{ACCOUNT_SERVICE_URL}/api/accounts/stats",
+            headers=headers, timeout=UPSTREAM_TIMEOUT
+        )),
+        'transactions': ('Transaction service', upstream_executor.submit(
+            service_client.get, f"{TRANSACTION_SERVICE_URL}/api/transactions/all",
+            headers=headers, timeout=UPSTREAM_TIMEOUT,
+            params={'start': start_date.isoformat(), 'end': end_date.isoformat()}
+        ))
+    }
     
-    # Get all accounts
-    try:
-        response = requests.get(
-            f"{ACCOUNT_SERVICE_URL}/api/accounts/all",
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        
-        if not response.ok:
-            return jsonify({'message': 'Failed to retrieve accounts'}), response.status_code
-            
-        accounts = response.json().get('accounts', [])
-        
-    except requests.RequestException:
-        return jsonify({'message': 'Account service unavailable'}), 503
+    # The whole fan-out shares one deadline
+    done, not_done = wait([future for _, future in upstreams.values()], timeout=UPSTREAM_TIMEOUT)
+    for future in not_done:
+        future.cancel()
     
-    # Get all transactions
-    try:
-        response = requests.get(
-            f"{TRANSACTION_SERVICE_URL}/api/transactions/all",
-            headers={'Authorization': f'Bearer {token}'}
-        )
+    results = {}
+    for key, (service, future) in upstreams.items():
+        if future not in done:
+            return jsonify({'message': f'{service} timed out'}), 504
+        
+        try:
+            response = future.result()
+        except requests.RequestException:
+            return jsonify({'message': f'{service} unavailable'}), 503
         
         if not response.ok:
-            return jsonify({'message': 'Failed to retrieve transactions'}), response.status_code
-            
-        transactions = response.json().get('transactions', [])
+            return jsonify({'message': f'Failed to retrieve {key.replace("_", " ")}'}), response.status_code
         
-    except requests.RequestException:
-        return jsonify({'message': 'Transaction service unavailable'}), 503
+        results[key] = response.json()
     
-    # Filter transactions by date
-    filtered_transactions = filter_transactions_by_date(transactions, start_date, end_date)
+    users = results['users'].get('users', [])
+    account_stats = results['account_stats']
+    filtered_transactions = results['transactions'].get('transactions', [])
     
     # Calculate summary statistics
     transaction_summary = calculate_summary(filtered_transactions)
     
-    # Calculate additional system stats
+    # Account totals are aggregated by the account service
     system_stats = {
         'total_users': len(users),
-        'total_accounts': len(accounts),
-        'total_balance': sum(a['balance'] for a in accounts),
-        'active_accounts': sum(1 for a in accounts if a['status'] == 'active'),
-        'closed_accounts': sum(1 for a in accounts if a['status'] == 'closed'),
-        'account_types': {}
+        'total_accounts': account_stats['total_accounts'],
+        'total_balance': account_stats['total_balance'],
+        'active_accounts': account_stats['active_accounts'],
+        'closed_accounts': account_stats['closed_accounts'],
+        'account_types': account_stats['account_types']
     }
     
-    # Count by account type
-    for a in accounts:
-        a_type = a['account_type']
-        if a_type not in system_stats['account_types']:
-            system_stats['account_types'][a_type] = {
-                'count': 0,
-                'balance': 0
-            }
-        system_stats['account_types'][a_type]['count'] += 1
-        system_stats['account_types'][a_type]['balance'] += a['balance']
-    
     # Create report
     report_data = {
         'period': {
@@ -451,6 +624,55 @@ def system_report(current_user):
             'report': report.to_dict()
         }), 200
 
+@app.route('/api/reports/timeseries', methods=['GET'])
+@token_required
+def timeseries_report(current_user):
+    """Cash-flow time series (daily/weekly/monthly buckets) for an account or all user accounts"""
+    params = {
+        'interval': request.args.get('interval', 'day')
+    }
+    for key in ('account_id', 'start_date', 'end_date'):
+        if request.args.get(key):
+            params[key] = request.args[key]
+    
+    # Bucketing happens in the transaction service database, so only the series crosses the wire
+    try:
+        token = request.headers.get('Authorization').split(' ')[1]
+        
+        # Reject accounts the caller does not own before involving the transaction service
+        if (params.get('account_id') and current_user['role'] != 'admin' and
+                not ownership_cache.owns_any(current_user['user_id'], token, [params['account_id']])):
+            return jsonify({'message': 'Failed to access account'}), 403
+        
+        response = service_client.get(
+            f"{TRANSACTION_SERVICE_URL}/api/transactions/timeseries",
+            headers={'Authorization': f'Bearer {token}'},
+            params=params
+        )
+        
+        if not response.ok:
+            return jsonify({'message': response.json().get('message', 'Failed to retrieve time series')}), response.status_code
+            
+        timeseries = response.json()
+        
+    except requests.HTTPError as e:
+        return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
+    except requests.RequestException:
+        return jsonify({'message': 'Transaction service unavailable'}), 503
+    
+    # Totals per type across the whole window
+    totals = {'count': 0, 'amount': 0, 'by_type': {}}
+    for point in timeseries['series']:
+        totals['count'] += point['count']
+        totals['amount'] += point['amount']
+        for t_type, data in point['by_type'].items():
+            type_totals = totals['by_type'].setdefault(t_type, {'count': 0, 'amount': 0})
+            type_totals['count'] += data['count']
+            type_totals['amount'] += data['amount']
+    
+    timeseries['totals'] = totals
+    return jsonify(timeseries), 200
+
 @app.route('/api/reports/list', methods=['GET'])
 @token_required
 def list_reports(current_user):
@@ -474,8 +696,64 @@ def report_details(current_user, report_id):
         # Check if the report belongs to the current user or user is admin
         if report.user_id != current_user['user_id'] and current_user['role'] != 'admin':
             return jsonify({'message': 'Access denied'}), 403
-            
-        return jsonify(report.to_dict()), 200
+        
+        report_dict = report.to_dict()
+        transaction_ref = report_dict['report_data'].get('transaction_ref')
+        
+        # Snapshot reports never change once generated
+        if not transaction_ref or 'transactions' in report_dict['report_data']:
+            return conditional_json(
+                etag_for(report.id, report.created_at),
+                lambda: report_dict,
+                last_modified=report.created_at,
+                immutable=True
+            )
+        
+        # Referenced reports are materialized on demand from live transaction data (nothing is
+        # written back), so their ETag covers what was materialized and clients must revalidate
+        try:
+            token = request.headers.get('Authorization').split(' ')[1]
+            transactions = materialize_transactions(transaction_ref, token)
+        except requests.RequestException:
+            return jsonify({'message': 'Transaction service unavailable'}), 503
+        
+        report_dict['report_data'] = dict(report_dict['report_data'], transactions=transactions)
+        return conditional_json(etag_for(report.id, report.created_at, transactions), lambda: report_dict)
+
+@app.route('/api/reports/compact', methods=['POST'])
+@token_required
+@admin_required
+def compact_reports_endpoint(current_user):
+    """Convert stored reports to referenced, compressed storage (admin only)"""
+    try:
+        batch_size = int(request.args.get('batch_size', 100))
+    except ValueError:
+        batch_size = 0
+    if batch_size <= 0:
+        return jsonify({'message': 'batch_size must be a positive integer'}), 400
+    return jsonify({'compacted': compact_reports(batch_size)}), 200
+
+@app.route('/api/reports/retention', methods=['GET'])
+@token_required
+@admin_required
+def retention_status(current_user):
+    """Retention policy and purge metrics (admin only)"""
+    with retention_lock:
+        stats = dict(retention_stats, purged_by_type=dict(retention_stats['purged_by_type']))
+    return jsonify({
+        'policy': RETENTION_POLICY,
+        'interval_seconds': RETENTION_INTERVAL,
+        'batch_size': RETENTION_BATCH_SIZE,
+        'stats': stats
+    }), 200
+
+@app.route('/api/reports/retention/run', methods=['POST'])
+@token_required
+@admin_required
+def run_retention(current_user):
+    """Run the retention purge immediately (admin only)"""
+    purged = purge_reports()
+    return jsonify({'purged': purged, 'total': sum(purged.values())}), 200
 
 @app.route('/api/reports/all', methods=['GET'])
 @token_required
@@ -488,5 +766,26 @@ def all_reports(current_user):
             'reports': [report.to_dict() for report in reports]
         }), 200
 
+# Startup runs once per process, whichever entry point asks for the app first
+started = False
+
+def create_app():
+    """Run the service's startup tasks once and return the app.
+    Importing this module performs no database or network I/O; servers call this instead."""
+    global started
+    if started:
+        return app
+    started = True
+    
+    with app.app_context():
+        db.create_all()
+        add_missing_columns(db, Report)
+        create_missing_indexes(db, Report)
+    if RETENTION_INTERVAL > 0:
+        threading.Thread(target=retention_worker, args=(RETENTION_INTERVAL,), daemon=True, name='report-retention').start()
+    event_bus.start()
+    register_in_background(SERVICE_NAME, SERVICE_PORT, address=SERVICE_HOST)
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='localhost', port=8004)
\ No newline at end of file
+    create_app().run(debug=True, host=SERVICE_HOST, port=SERVICE_PORT)
\ No newline at end of file
@@ -5,11 +5,57 @@ Run Services Script - Helps manage the microservices for the banking application
 
 import os
 import sys
+import json
 import subprocess
 import argparse
 import signal
 import time
+import threading
+import urllib.request
+import urllib.error
 import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Module, WSGI app, bind address, health endpoint and startup dependencies of each service.
+# Backend addresses follow <SERVICE>_SERVICE_HOST/_PORT, the same variables the services register with.
+# Backend services only call each other while serving requests, so they can boot in parallel;
+# traffic enters through the gateway, which waits until all of them are ready.
+SERVICES = [
+    {'key': 'auth', 'name': 'Auth Service', 'module': 'auth_service.auth_service', 'app': 'create_app()',
+     'host': os.environ.get('AUTH_SERVICE_HOST', 'localhost'), 'port': int(os.environ.get('AUTH_SERVICE_PORT', 8001)),
+     'health': '/api/health', 'depends_on': []},
+    {'key': 'account', 'name': 'Account Service', 'module': 'account_service.account_service', 'app': 'create_app()',
+     'host': os.environ.get('ACCOUNT_SERVICE_HOST', 'localhost'), 'port': int(os.environ.get('ACCOUNT_SERVICE_PORT', 8002)),
+     'health': '/api/health', 'depends_on': []},
+    {'key': 'transaction', 'name': 'Transaction Service', 'module': 'transaction_service.transaction_service',
+     'app': 'create_app()', 'host': os.environ.get('TRANSACTION_SERVICE_HOST', 'localhost'),
+     'port': int(os.environ.get('TRANSACTION_SERVICE_PORT', 8003)), 'health': '/api/health', 'depends_on': []},
+    {'key': 'reporting', 'name': 'Reporting Service', 'module': 'reporting_service.reporting_service',
+     'app': 'create_app()', 'host': os.environ.get('REPORTING_SERVICE_HOST', 'localhost'),
+     'port': int(os.environ.get('REPORTING_SERVICE_PORT', 8004)), 'health': '/api/health', 'depends_on': []},
+    {'key': 'gateway', 'name': 'API Gateway', 'module': 'main', 'app': 'app',
+     'host': '0.0.0.0', 'port': 5000, 'health': '/health', 'sessions': True,
+     'depends_on': ['auth', 'account', 'transaction', 'reporting']},
+]
+
+# Everything in one process: the gateway plus every service, called in-process
+MONOLITH = {'key': 'monolith', 'name': 'Monolith', 'module': 'monolith', 'app': 'app',
+            'host': '0.0.0.0', 'port': 5000, 'health': '/health', 'sessions': True, 'depends_on': []}
+
+# How long a service may take to answer its health endpoint before startup is aborted (seconds)
+STARTUP_TIMEOUT = float(os.environ.get('STARTUP_TIMEOUT', 60))
+
+# Delay before restarting a crashed service doubles up to the maximum, and resets once the
+# service has stayed up for RESTART_STABLE_AFTER (seconds)
+RESTART_BACKOFF_INITIAL = float(os.environ.get('RESTART_BACKOFF_INITIAL', 1))
+RESTART_BACKOFF_MAX = float(os.environ.get('RESTART_BACKOFF_MAX', 30))
+RESTART_STABLE_AFTER = float(os.environ.get('RESTART_STABLE_AFTER', 60))
+
+# Time services get to drain after SIGTERM before they are killed (seconds)
+SHUTDOWN_TIMEOUT = float(os.environ.get('SHUTDOWN_TIMEOUT', 30))
+
+# Port of the supervisor's JSON status endpoint on localhost; 0 disables it
+SUPERVISOR_STATUS_PORT = int(os.environ.get('SUPERVISOR_STATUS_PORT', 9000))
 
 def load_module(module_name, file_path):
     """Load a module from file path"""
@@ -25,77 +71,279 @@ def parse_args():
     parser.add_argument('--no-transaction', action='store_true', help='Do not run the transaction service')
     parser.add_argument('--no-reporting', action='store_true', help='Do not run the reporting service')
     parser.add_argument('--no-gateway', action='store_true', help='Do not run the API gateway')
+    parser.add_argument('--monolith', action='store_true',
+                        help='Run the gateway and all services in one process with in-process service calls')
+    parser.add_argument('--mode', choices=['dev', 'gunicorn'], default=os.environ.get('RUN_MODE', 'dev'),
+                        help='dev: Flask development servers; gunicorn: multi-process production servers')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 1)),
+                        help='Gunicorn worker processes per service (override per service with e.g. AUTH_WORKERS)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('GUNICORN_THREADS', 2)),
+                        help='Threads per gunicorn worker (override per service with e.g. AUTH_THREADS)')
+    parser.add_argument('--no-preload', action='store_true',
+                        help='Import the app in each worker instead of once in the gunicorn master')
     return parser.parse_args()
 
+def service_workers(service, args):
+    """Number of gunicorn workers a service runs with"""
+    return int(os.environ.get(f"{service['key'].upper()}_WORKERS", args.workers))
+
+def service_env(service, args):
+    """Environment for a service process. A gateway with several workers keeps sessions in
+    sqlite unless SESSION_STORE is set, since the memory store is not shared between workers."""
+    env = dict(os.environ)
+    if (service.get('sessions') and args.mode == 'gunicorn' and 'SESSION_STORE' not in env
+            and service_workers(service, args) > 1):
+        env['SESSION_STORE'] = 'sqlite'
+    return env
+
+def service_command(service, args):
+    """Build the command that launches a service in the selected mode"""
+    if args.mode == 'dev':
+        if service['key'] == 'gateway':
+            return [sys.executable, "main.py"]
+        return [sys.executable, "-m", service['module']]
+    
+    prefix = service['key'].upper()
+    workers = service_workers(service, args)
+    threads = int(os.environ.get(f"{prefix}_THREADS", args.threads))
+    
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--config", "gunicorn_config.py",
+        "--bind", f"{service['host']}:{service['port']}",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--name", service['key'],
+    ]
+    if not args.no_preload:
+        # Import once in the master and fork workers from it
+        command.append("--preload")
+    command.append(f"{service['module']}:{service['app']}")
+    return command
+
+def wait_until_ready(service, process, timeout=STARTUP_TIMEOUT):
+    """Poll a service's health endpoint with backoff until it answers.
+    Returns False if the process exits or the timeout passes first."""
+    host = 'localhost' if service['host'] == '0.0.0.0' else service['host']
+    url = f"http://{host}:{service['port']}{service['health']}"
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return True
+        except urllib.error.HTTPError:
+            # An error status still means the server is up (the gateway reports degraded backends)
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.5)
+    return False
+
+class Supervisor:
+    """Launches services and keeps them running, restarting crashed ones with exponential backoff"""
+    
+    def __init__(self, args):
+        self.args = args
+        self.states = {}  # service key -> launch and restart state
+        # Reentrant because signal handlers run on the main thread, possibly while it holds the lock
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
+    
+    def launch(self, service):
+        """Start a service process and record it as starting"""
+        command = service_command(service, self.args)
+        print(f"Starting {service['name']}: {' '.join(command)}")
+        process = subprocess.Popen(command, env=service_env(service, self.args))
+        
+        with self.lock:
+            state = self.states.setdefault(service['key'], {
+                'service': service, 'restarts': 0, 'backoff': 0, 'last_exit_code': None
+            })
+            state.update(process=process, status='starting', started_at=time.monotonic(), restart_at=None)
+        return process
+    
+    def await_ready(self, service, process):
+        """Wait for a launched process to answer its health check and mark it running"""
+        launched_at = time.monotonic()
+        if not wait_until_ready(service, process):
+            print(f"{service['name']} failed to become ready")
+            if process.poll() is None:
+                process.kill()  # Hung; the supervisor loop will restart it
+            return False
+        
+        with self.lock:
+            state = self.states[service['key']]
+            if state['process'] is process:
+                state['status'] = 'running'
+        print(f"{service['name']} ready in {time.monotonic() - launched_at:.2f}s")
+        return True
+    
+    def start(self):
+        """Start each service as soon as its dependencies are ready, independent ones in parallel.
+        Returns True if every selected service became ready."""
+        if self.args.monolith:
+            selected = [MONOLITH]
+        else:
+            selected = [service for service in SERVICES if not getattr(self.args, f"no_{service['key']}")]
+        ready = {service['key']: threading.Event() for service in selected}
+        failed = threading.Event()
+        started_at = time.monotonic()
+        
+        def start_one(service):
+            # Skipped services are assumed to be running elsewhere
+            for dependency in service['depends_on']:
+                if dependency in ready:
+                    while not ready[dependency].wait(0.1):
+                        if failed.is_set():
+                            return
+            
+            process = self.launch(service)
+            if self.await_ready(service, process):
+                ready[service['key']].set()
+            else:
+                failed.set()
+        
+        threads = [threading.Thread(target=start_one, args=(service,), daemon=True) for service in selected]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if failed.is_set():
+            return False
+        
+        print(f"All services ready in {time.monotonic() - started_at:.2f}s")
+        return True
+    
+    def supervise(self):
+        """Restart services that exit until shutdown is requested"""
+        while not self.stopping.wait(0.5):
+            now = time.monotonic()
+            due = []
+            
+            with self.lock:
+                for state in self.states.values():
+                    service = state['service']
+                    
+                    if state['status'] in ('starting', 'running') and state['process'].poll() is not None:
+                        # A service that stayed up long enough starts over with the shortest delay
+                        if now - state['started_at'] >= RESTART_STABLE_AFTER:
+                            state['backoff'] = 0
+                        state['backoff'] = min(state['backoff'] * 2, RESTART_BACKOFF_MAX) or RESTART_BACKOFF_INITIAL
+                        state['last_exit_code'] = state['process'].returncode
+                        state['status'] = 'backoff'
+                        state['restart_at'] = now + state['backoff']
+                        print(f"{service['name']} exited with code {state['last_exit_code']}; "
+                              f"restarting in {state['backoff']:.1f}s")
+                    
+                    elif state['status'] == 'backoff' and now >= state['restart_at']:
+                        state['restarts'] += 1
+                        due.append(service)
+            
+            for service in due:
+                process = self.launch(service)
+                threading.Thread(target=self.await_ready, args=(service, process), daemon=True).start()
+    
+    def signal_all(self, sig):
+        """Send a signal to every running service process"""
+        with self.lock:
+            processes = [state['process'] for state in self.states.values()]
+        for process in processes:
+            if process.poll() is None:  # If process is still running
+                process.send_signal(sig)
+        return processes
+    
+    def shutdown(self):
+        """Forward SIGTERM so services drain in-flight requests, then kill any that outlive the timeout"""
+        self.stopping.set()
+        processes = self.signal_all(signal.SIGTERM)
+        
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for process in processes:
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    def status(self):
+        """Current state, pid, uptime and restart count of every service"""
+        now = time.monotonic()
+        with self.lock:
+            return {
+                key: {
+                    'name': state['service']['name'],
+                    'status': state['status'],
+                    'pid': state['process'].pid if state['status'] != 'backoff' else None,
+                    'uptime': round(now - state['started_at'], 1) if state['status'] != 'backoff' else 0,
+                    'restarts': state['restarts'],
+                    'last_exit_code': state['last_exit_code']
+                }
+                for key, state in self.states.items()
+            }
+    
+    def serve_status(self, port):
+        """Serve the status as JSON on localhost in a background thread"""
+        supervisor = self
+        
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps({'services': supervisor.status()}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('localhost', port), StatusHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Supervisor status available at http://localhost:{port}/")
+
 def run_services(args):
     """Run services based on arguments"""
-    processes = []
+    supervisor = Supervisor(args)
     
-    # Setup signal handler
+    # Setup signal handlers; SIGTERM is forwarded so services can drain gracefully
     def signal_handler(sig, frame):
         print('Stopping all services...')
-        for process in processes:
-            if process.poll() is None:  # If process is still running
-                process.terminate()
+        supervisor.shutdown()
         sys.exit(0)
     
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    # SIGHUP gracefully replaces every gunicorn worker; without preloading this also reloads code
+    def reload_handler(sig, frame):
+        print('Reloading all services...')
+        supervisor.signal_all(signal.SIGHUP)
+    
+    if args.mode == 'gunicorn':
+        signal.signal(signal.SIGHUP, reload_handler)
     
     try:
-        # Run Auth Service
-        if not args.no_auth:
-            auth_cmd = [sys.executable, "-m", "auth_service.auth_service"]
-            print(f"Starting Auth Service: {' '.join(auth_cmd)}")
-            auth_process = subprocess.Popen(auth_cmd)
-            processes.append(auth_process)
-            time.sleep(1)  # Give it a moment to start
-        
-        # Run Account Service
-        if not args.no_account:
-            account_cmd = [sys.executable, "-m", "account_service.account_service"]
-            print(f"Starting Account Service: {' '.join(account_cmd)}")
-            account_process = subprocess.Popen(account_cmd)
-            processes.append(account_process)
-            time.sleep(1)  # Give it a moment to start
-        
-        # Run Transaction Service
-        if not args.no_transaction:
-            transaction_cmd = [sys.executable, "-m", "transaction_service.transaction_service"]
-            print(f"Starting Transaction Service: {' '.join(transaction_cmd)}")
-            transaction_process = subprocess.Popen(transaction_cmd)
-            processes.append(transaction_process)
-            time.sleep(1)  # Give it a moment to start
+        if SUPERVISOR_STATUS_PORT:
+            supervisor.serve_status(SUPERVISOR_STATUS_PORT)
         
-        # Run Reporting Service
-        if not args.no_reporting:
-            reporting_cmd = [sys.executable, "-m", "reporting_service.reporting_service"]
-            print(f"Starting Reporting Service: {' '.join(reporting_cmd)}")
-            reporting_process = subprocess.Popen(reporting_cmd)
-            processes.append(reporting_process)
-            time.sleep(1)  # Give it a moment to start
+        if not supervisor.start():
+            print('Stopping all services...')
+            supervisor.shutdown()
+            sys.exit(1)
         
-        # Run API Gateway (main.py)
-        if not args.no_gateway:
-            gateway_cmd = [sys.executable, "main.py"]
-            print(f"Starting API Gateway: {' '.join(gateway_cmd)}")
-            gateway_process = subprocess.Popen(gateway_cmd)
-            processes.append(gateway_process)
-        
-        # Wait for all processes
-        for process in processes:
-            process.wait()
+        supervisor.supervise()
             
     except KeyboardInterrupt:
         print('Stopping all services...')
-        for process in processes:
-            if process.poll() is None:  # If process is still running
-                process.terminate()
+        supervisor.shutdown()
         sys.exit(0)
     except Exception as e:
         print(f"Error: {e}")
-        for process in processes:
-            if process.poll() is None:  # If process is still running
-                process.terminate()
+        supervisor.shutdown()
         sys.exit(1)
 
 def main():
@@ -0,0 +1,47 @@
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+def column_names(db, table):
+    """Names of the columns a table currently has in the database"""
+    return {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+
+def add_missing_columns(db, *models):
+    """Add model columns missing from tables created by an earlier version.
+    db.create_all() only creates missing tables, so services run this on every start, before
+    any queries. New columns are added as nullable without a database default."""
+    for model in models:
+        table = model.__table__
+        existing = column_names(db, table)
+        
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                logger.info(f"Added column {table.name}.{column.name}")
+            except DBAPIError:
+                # Another worker starting at the same time may have added it first
+                if column.name not in column_names(db, table):
+                    raise
+
+def create_missing_indexes(db, *models):
+    """Create model indexes missing from tables created by an earlier version, which
+    db.create_all() skips because the table already exists"""
+    for model in models:
+        for index in model.__table__.indexes:
+            try:
+                with db.engine.begin() as connection:
+                    if inspect(connection).has_index(model.__tablename__, index.name):
+                        continue
+                    index.create(bind=connection)
+                logger.info(f"Created index {index.name}")
+            except DBAPIError:
+                # Another worker starting at the same time may have created it first
+                if not inspect(db.engine).has_index(model.__tablename__, index.name):
+                    raise
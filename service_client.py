@@ -0,0 +1,221 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from service_discovery import discovery_from_environment
+
+logger = logging.getLogger(__name__)
+
+# One session for every inter-service call, so connections to other services are reused.
+# It is shared between users, so it must never remember cookies.
+session = requests.Session()
+session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+# Timeout for inter-service calls that do not pass their own (seconds)
+SERVICE_TIMEOUT = float(os.environ.get("SERVICE_TIMEOUT", 10))
+
+# Circuit breaker: an upstream's circuit opens once CIRCUIT_FAILURE_RATE of its last CIRCUIT_WINDOW
+# calls failed (counting only after CIRCUIT_MIN_CALLS), and a trial call is let through after
+# CIRCUIT_OPEN_SECONDS
+CIRCUIT_WINDOW = int(os.environ.get("CIRCUIT_WINDOW", 20))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", 10))
+CIRCUIT_FAILURE_RATE = float(os.environ.get("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", 15))
+
+# Bulkhead: most concurrent calls to one upstream, and how long a call may wait for a slot (seconds)
+BULKHEAD_MAX_CONCURRENT = int(os.environ.get("BULKHEAD_MAX_CONCURRENT", 20))
+BULKHEAD_WAIT = float(os.environ.get("BULKHEAD_WAIT", 0.1))
+
+# Resolves configured service URLs to live instances; None when discovery is disabled
+discovery = discovery_from_environment()
+# Base URLs served in-process, which are never resolved through discovery
+in_process_urls = set()
+
+class UpstreamUnavailable(requests.RequestException):
+    """Raised without contacting an upstream whose circuit is open or whose bulkhead is full"""
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one upstream: closed, open, then half-open for one trial call"""
+
+    def __init__(self, upstream, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS,
+                 failure_rate=CIRCUIT_FAILURE_RATE, open_seconds=CIRCUIT_OPEN_SECONDS):
+        """Initialize a closed circuit"""
+        self.upstream = upstream
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.outcomes = deque(maxlen=window)  # True for each recent success, False for each failure
+        self.state = 'closed'
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise UpstreamUnavailable unless a call may go through now"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    raise UpstreamUnavailable(f"Circuit for {self.upstream} is open")
+                self.state = 'half_open'
+                return
+            if self.state == 'half_open':
+                # The trial call is still running
+                raise UpstreamUnavailable(f"Circuit for {self.upstream} is open")
+
+    def record(self, success):
+        """Record the outcome of a call that before_call let through"""
+        with self._lock:
+            if self.state == 'half_open':
+                if success:
+                    self.state = 'closed'
+                    self.outcomes.clear()
+                    logger.info(f"Circuit for {self.upstream} closed")
+                else:
+                    self.open()
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if (self.state == 'closed' and len(self.outcomes) >= self.min_calls
+                    and failures / len(self.outcomes) >= self.failure_rate):
+                self.open()
+
+    def open(self):
+        """Stop calls to the upstream for open_seconds; the caller holds the lock"""
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        logger.warning(f"Circuit for {self.upstream} opened")
+
+# Circuit breaker and bulkhead semaphore of each upstream, keyed by host:port
+upstream_guards = {}
+upstream_guards_lock = threading.Lock()
+
+def guards_for(upstream):
+    """Get the circuit breaker and bulkhead of an upstream, creating them on first use"""
+    with upstream_guards_lock:
+        if upstream not in upstream_guards:
+            upstream_guards[upstream] = (
+                CircuitBreaker(upstream),
+                threading.BoundedSemaphore(BULKHEAD_MAX_CONCURRENT),
+            )
+        return upstream_guards[upstream]
+
+def guarded_request(method, url, **kwargs):
+    """Send a request through its upstream's bulkhead and circuit breaker.
+    Connection errors, timeouts and 5xx responses count as failures."""
+    upstream = urlsplit(url).netloc
+    breaker, bulkhead = guards_for(upstream)
+    if not bulkhead.acquire(timeout=BULKHEAD_WAIT):
+        raise UpstreamUnavailable(f"Too many concurrent calls to {upstream}")
+    try:
+        breaker.before_call()
+        success = False
+        try:
+            response = session.request(method, url, **kwargs)
+            success = response.status_code < 500
+            return response
+        finally:
+            breaker.record(success)
+    finally:
+        bulkhead.release()
+
+class WSGIAdapter(BaseAdapter):
+    """Transport adapter that hands requests straight to a WSGI app instead of the network"""
+
+    def __init__(self, wsgi_app, base_url):
+        """Initialize the adapter for an app served at base_url"""
+        super().__init__()
+        self.wsgi_app = wsgi_app
+        self.base_url = base_url.rstrip('/')
+        self.script_root = urlsplit(self.base_url).path
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        """Run the request through the app and wrap its output in a requests.Response"""
+        url = urlsplit(request.url)
+        # Nothing crosses a network, so compressing bodies would only cost CPU
+        headers = {
+            key: value for key, value in request.headers.items()
+            if key.lower() not in ('accept-encoding', 'content-length')
+        }
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        environ = EnvironBuilder(
+            path=url.path[len(self.script_root):] or '/',
+            base_url=self.base_url,
+            query_string=url.query,
+            method=request.method,
+            headers=headers,
+            data=body
+        ).get_environ()
+
+        app_iter, status, response_headers = run_wsgi_app(self.wsgi_app, environ, buffered=True)
+        try:
+            content = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        response = requests.Response()
+        code, _, reason = status.partition(' ')
+        response.status_code = int(code)
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(response_headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        """Nothing to release"""
+
+def mount_in_process(base_url, wsgi_app):
+    """Serve calls to base_url from wsgi_app in this process instead of over HTTP"""
+    session.mount(base_url.rstrip('/') + '/', WSGIAdapter(wsgi_app, base_url))
+    in_process_urls.add(base_url.rstrip('/'))
+    logger.info(f"Calls to {base_url} are served in-process")
+
+def request(method, url, **kwargs):
+    """Make an inter-service request; accepts the same arguments as requests.request.
+    With discovery enabled, the configured service URL is replaced by a balanced live instance.
+    Calls fail fast with UpstreamUnavailable while the upstream's circuit is open or its bulkhead is full."""
+    kwargs.setdefault('timeout', SERVICE_TIMEOUT)
+    target = discovery.service_for(url) if discovery else None
+    if target is None or target[1].rstrip('/') in in_process_urls:
+        return guarded_request(method, url, **kwargs)
+
+    name, base_url = target
+    instance = discovery.acquire(name)
+    try:
+        return guarded_request(method, instance.rstrip('/') + url[len(base_url.rstrip('/')):], **kwargs)
+    except requests.ConnectionError:
+        discovery.evict(name, instance)
+        raise
+    finally:
+        discovery.release(instance)
+
+def get(url, **kwargs):
+    """Make an inter-service GET request"""
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    """Make an inter-service POST request"""
+    return request('POST', url, **kwargs)
+
+def put(url, **kwargs):
+    """Make an inter-service PUT request"""
+    return request('PUT', url, **kwargs)
+
+def delete(url, **kwargs):
+    """Make an inter-service DELETE request"""
+    return request('DELETE', url, **kwargs)
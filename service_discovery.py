@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Where service instances are looked up: none (use the configured URLs), consul or file
+DISCOVERY_BACKEND = os.environ.get("DISCOVERY_BACKEND", "none")
+# JSON file mapping service names to lists of instance base URLs, for DISCOVERY_BACKEND=file
+DISCOVERY_FILE = os.environ.get("DISCOVERY_FILE", "services.json")
+# How long a resolved instance list is used before it is refreshed in the background (seconds)
+DISCOVERY_REFRESH_INTERVAL = float(os.environ.get("DISCOVERY_REFRESH_INTERVAL", 10))
+# round_robin or least_outstanding
+LOAD_BALANCING = os.environ.get("LOAD_BALANCING", "round_robin")
+
+CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
+CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
+
+# Configured base URL of each service; requests to it are spread over the discovered instances
+SERVICE_URLS = {
+    'auth-service': os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001"),
+    'account-service': os.environ.get("ACCOUNT_SERVICE_URL", "http://localhost:8002"),
+    'transaction-service': os.environ.get("TRANSACTION_SERVICE_URL", "http://localhost:8003"),
+    'reporting-service': os.environ.get("REPORTING_SERVICE_URL", "http://localhost:8004"),
+}
+
+class ConsulCatalog:
+    """Looks up instances passing their health checks in Consul"""
+
+    def __init__(self, host=CONSUL_HOST, port=CONSUL_PORT):
+        """Initialize the Consul client"""
+        import consul
+        self.client = consul.Consul(host=host, port=port)
+
+    def lookup(self, name):
+        """Get the base URLs of the healthy instances of a service"""
+        _, entries = self.client.health.service(name, passing=True)
+        return [
+            f"http://{entry['Service']['Address'] or entry['Node']['Address']}:{entry['Service']['Port']}"
+            for entry in entries
+        ]
+
+class FileCatalog:
+    """Static stand-in for Consul: a JSON file of service name -> instance base URLs"""
+
+    def __init__(self, path=DISCOVERY_FILE):
+        """Initialize the catalog for the given file"""
+        self.path = path
+
+    def lookup(self, name):
+        """Get the base URLs listed for a service"""
+        with open(self.path) as f:
+            return list(json.load(f).get(name, []))
+
+class ServiceDiscovery:
+    """Cached instance lookups with client-side load balancing"""
+
+    def __init__(self, catalog, refresh_interval=DISCOVERY_REFRESH_INTERVAL, strategy=LOAD_BALANCING):
+        """Initialize discovery over the given catalog"""
+        self.catalog = catalog
+        self.refresh_interval = refresh_interval
+        self.strategy = strategy
+        self._instances = {}  # service name -> (fetched_at, [instance base URLs])
+        self._refreshing = set()
+        self._outstanding = defaultdict(int)  # instance base URL -> requests in flight
+        self._counters = defaultdict(itertools.count)
+        self._lock = threading.Lock()
+
+    def service_for(self, url):
+        """Get (service name, configured base URL) for a URL addressed to a known service, else None"""
+        for name, base_url in SERVICE_URLS.items():
+            if url == base_url or url.startswith(base_url.rstrip('/') + '/'):
+                return name, base_url
+        return None
+
+    def refresh(self, name):
+        """Fetch a service's instances from the catalog; on failure the previous list is kept"""
+        try:
+            instances = self.catalog.lookup(name)
+        except Exception as e:
+            logger.warning(f"Failed to look up {name}: {e}")
+            instances = None
+
+        with self._lock:
+            self._refreshing.discard(name)
+            if instances:
+                self._instances[name] = (time.monotonic(), instances)
+            elif name in self._instances:
+                # Keep serving the last known instances, and try again after another interval
+                self._instances[name] = (time.monotonic(), self._instances[name][1])
+            else:
+                logger.warning(f"No instances of {name} found, using {SERVICE_URLS[name]}")
+                self._instances[name] = (time.monotonic(), [SERVICE_URLS[name]])
+
+    def instances(self, name):
+        """Get the cached instances of a service, refreshing stale entries in the background"""
+        with self._lock:
+            entry = self._instances.get(name)
+            stale = entry is not None and time.monotonic() - entry[0] > self.refresh_interval
+            if stale and name not in self._refreshing:
+                self._refreshing.add(name)
+                threading.Thread(target=self.refresh, args=(name,), daemon=True).start()
+
+        if entry is None:
+            self.refresh(name)
+            with self._lock:
+                entry = self._instances[name]
+        return entry[1]
+
+    def acquire(self, name):
+        """Pick an instance for a request and count it as outstanding until release()"""
+        instances = self.instances(name)
+        with self._lock:
+            start = next(self._counters[name])
+            # Rotate so ties between equally loaded instances are broken round-robin
+            rotated = instances[start % len(instances):] + instances[:start % len(instances)]
+            if self.strategy == 'least_outstanding':
+                instance = min(rotated, key=lambda candidate: self._outstanding[candidate])
+            else:
+                instance = rotated[0]
+            self._outstanding[instance] += 1
+        return instance
+
+    def release(self, instance):
+        """Mark a request to an instance as finished"""
+        with self._lock:
+            self._outstanding[instance] -= 1
+
+    def evict(self, name, instance):
+        """Stop using an unreachable instance until the next refresh"""
+        with self._lock:
+            entry = self._instances.get(name)
+            if entry and instance in entry[1] and len(entry[1]) > 1:
+                self._instances[name] = (entry[0], [other for other in entry[1] if other != instance])
+
+def discovery_from_environment():
+    """Create discovery for the configured backend, or None when discovery is disabled"""
+    if DISCOVERY_BACKEND == 'consul':
+        try:
+            return ServiceDiscovery(ConsulCatalog())
+        except ImportError:
+            logger.warning("DISCOVERY_BACKEND=consul but python-consul is not installed; using configured URLs")
+            return None
+    if DISCOVERY_BACKEND == 'file':
+        return ServiceDiscovery(FileCatalog())
+    return None
@@ -0,0 +1,94 @@
+import os
+import time
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Consul configuration; without USE_CONSUL=true services do not register anywhere
+USE_CONSUL = os.environ.get("USE_CONSUL", "false").lower() == "true"
+CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
+CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
+
+# Longest wait between registration attempts while the registry is unreachable (seconds)
+REGISTRATION_RETRY_MAX = float(os.environ.get("REGISTRATION_RETRY_MAX", 30))
+
+class NoopRegistry:
+    """Registry backend used when Consul is disabled or unavailable"""
+
+    def register(self, name, service_id, address, port, health_path):
+        """Do nothing"""
+
+    def deregister(self, service_id):
+        """Do nothing"""
+
+class ConsulRegistry:
+    """Registry backend that registers services with a Consul agent"""
+
+    def __init__(self, host=CONSUL_HOST, port=CONSUL_PORT):
+        """Initialize the Consul client"""
+        import consul
+        self.consul = consul
+        self.client = consul.Consul(host=host, port=port)
+
+    def register(self, name, service_id, address, port, health_path):
+        """Register a service instance with an HTTP health check"""
+        self.client.agent.service.register(
+            name=name,
+            service_id=service_id,
+            address=address,
+            port=port,
+            check=self.consul.Check.http(
+                f"http://{address}:{port}{health_path}",
+                interval="10s",
+                timeout="5s",
+            ),
+        )
+
+    def deregister(self, service_id):
+        """Remove a service instance"""
+        self.client.agent.service.deregister(service_id)
+
+def registry_backend():
+    """Get the configured registry backend, falling back to a no-op one"""
+    if not USE_CONSUL:
+        return NoopRegistry()
+    try:
+        return ConsulRegistry()
+    except ImportError:
+        logger.warning("USE_CONSUL is set but python-consul is not installed; skipping registration")
+        return NoopRegistry()
+
+def register_in_background(name, port, address="localhost", health_path="/api/health", backend=None):
+    """Register a service on a daemon thread, retrying with backoff until the registry accepts it.
+    The instance is deregistered at exit. Returns the instance's service id."""
+    backend = backend or registry_backend()
+    service_id = f"{name}-{os.urandom(8).hex()}"
+    registered = threading.Event()
+
+    def register():
+        delay = 1
+        while True:
+            try:
+                backend.register(name, service_id, address, port, health_path)
+                registered.set()
+                logger.info(f"Registered service as {service_id}")
+                return
+            except Exception as e:
+                logger.warning(f"Failed to register {service_id}, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, REGISTRATION_RETRY_MAX)
+
+    def deregister():
+        if not registered.is_set():
+            return
+        try:
+            backend.deregister(service_id)
+            logger.info(f"Deregistered service: {service_id}")
+        except Exception as e:
+            logger.warning(f"Failed to deregister {service_id}: {e}")
+
+    threading.Thread(target=register, name=f"register-{name}", daemon=True).start()
+    atexit.register(deregister)
+    return service_id
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import secrets
+import logging
+import sqlite3
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# Where gateway sessions are kept: memory (one process) or sqlite (shared by workers on one host)
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", "sessions.db")
+SESSION_STORE_MAX_ENTRIES = int(os.environ.get("SESSION_STORE_MAX_ENTRIES", 10000))
+
+class MemorySessionStore:
+    """Sessions in a per-process dict, evicting the least recently used beyond max_entries"""
+
+    def __init__(self, max_entries=SESSION_STORE_MAX_ENTRIES):
+        """Initialize an empty store"""
+        self.max_entries = max_entries
+        self._entries = {}  # session id -> (expires_at, data)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        """Get a session's data, or None if it is unknown or expired"""
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+            if entry is None or entry[0] <= time.time():
+                return None
+            # Re-inserting keeps the dict ordered from least to most recently used
+            self._entries[sid] = entry
+            return dict(entry[1])
+
+    def set(self, sid, data, expires_at):
+        """Store a session's data until expires_at (epoch seconds)"""
+        with self._lock:
+            self._entries.pop(sid, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[sid] = (expires_at, dict(data))
+
+    def delete(self, sid):
+        """Remove a session"""
+        with self._lock:
+            self._entries.pop(sid, None)
+
+class SqliteSessionStore:
+    """Sessions in a SQLite file, so every gateway worker on a host sees the same ones"""
+
+    def __init__(self, path=SESSION_STORE_PATH):
+        """Initialize the store; the file is created on first use"""
+        self.path = path
+        self._local = threading.local()
+        self._ready = False
+        self._last_prune = 0
+
+        # SQLite connections do not survive fork (e.g. gunicorn --preload workers)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """Give a forked child its own connections"""
+        self._local = threading.local()
+
+    def _connect(self):
+        """Get this thread's connection, creating the sessions table on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        if not self._ready:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    "sid TEXT PRIMARY KEY, "
+                    "data TEXT NOT NULL, "
+                    "expires_at REAL NOT NULL)"
+                )
+            self._ready = True
+        return conn
+
+    def get(self, sid):
+        """Get a session's data, or None if it is unknown or expired"""
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, sid, data, expires_at):
+        """Store a session's data until expires_at (epoch seconds)"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                (sid, json.dumps(data), expires_at)
+            )
+            # Drop expired sessions now and then
+            now = time.time()
+            if now - self._last_prune > 60:
+                self._last_prune = now
+                conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def delete(self, sid):
+        """Remove a session"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session whose data lives in a session store; the cookie only carries its id"""
+
+    def __init__(self, data=None, sid=None):
+        """Initialize the session; a new id is generated if none is given"""
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(data, on_update)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.previous_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """Move the session to a fresh id, e.g. on login, so an id seen before cannot be reused"""
+        if self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in a MemorySessionStore or SqliteSessionStore"""
+
+    def __init__(self, store):
+        """Initialize the interface over a store"""
+        self.store = store
+
+    def open_session(self, app, request):
+        """Load the session named by the request's cookie, or start a new one"""
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return ServerSideSession()
+        return ServerSideSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        """Write a modified session back to the store and send its id"""
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        expires_at = expires.timestamp() if expires else time.time() + app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, dict(session), expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+def session_interface():
+    """Get a session interface over the configured store"""
+    if SESSION_STORE == 'sqlite':
+        return ServerSideSessionInterface(SqliteSessionStore())
+    return ServerSideSessionInterface(MemorySessionStore())
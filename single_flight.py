@@ -0,0 +1,63 @@
+import os
+import threading
+import requests
+import http_caching
+
+# Identical GETs in flight at the same time (same URL, query and token) share one upstream call
+GATEWAY_SINGLE_FLIGHT = os.environ.get("GATEWAY_SINGLE_FLIGHT", "true").lower() == "true"
+
+class Call:
+    """A call in flight and, once done, its result or error"""
+
+    def __init__(self):
+        """Initialize an unfinished call"""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one call whose outcome they all share"""
+
+    def __init__(self):
+        """Initialize an empty group"""
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn, or wait for the identical call already running and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Later calls start a fresh upstream request; only concurrent ones are shared
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+reads = SingleFlight()
+
+def get(url, params=None, headers=None):
+    """Make an inter-service GET, sharing the response with identical concurrent GETs.
+    The response's body is read once; each caller's response.json() returns its own copy.
+    Responses with an ETag are revalidated rather than re-fetched (see http_caching.get)."""
+    if not GATEWAY_SINGLE_FLIGHT:
+        return http_caching.get(url, params=params, headers=headers)
+
+    full_url = requests.Request('GET', url, params=params).prepare().url
+    key = (full_url, (headers or {}).get('Authorization'))
+    return reads.do(key, lambda: http_caching.get(url, params=params, headers=headers))
@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+import threading
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+# Rendered template fragments kept per process, and how long each may be reused (seconds)
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 1000))
+FRAGMENT_CACHE_TTL = float(os.environ.get("FRAGMENT_CACHE_TTL", 300))
+
+class FragmentCache:
+    """Rendered fragments by key, evicting the least recently used beyond max_entries"""
+
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL):
+        """Initialize an empty cache"""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = {}  # key -> (expires_at, rendered fragment)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get a rendered fragment, or None on a miss or expiry"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            # Re-inserting keeps the dict ordered from least to most recently used
+            self._entries[key] = entry
+            return entry[1]
+
+    def store(self, key, fragment):
+        """Cache a rendered fragment"""
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + self.ttl, fragment)
+
+    def clear(self):
+        """Drop every fragment"""
+        with self._lock:
+            self._entries.clear()
+
+class FragmentCacheExtension(Extension):
+    """Adds {% cache "name", value, ... %}...{% endcache %} to templates.
+
+    The block is rendered once per distinct set of values and reused while they
+    stay the same, so the values must include everything the block shows. A
+    digest of them stands in for a data version, e.g. {% cache "accounts", accounts %}.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        """Attach a fragment cache to the environment"""
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        """Parse the name, the values the fragment depends on, and the body"""
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        values = []
+        while parser.stream.skip_if('comma'):
+            values.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('render_cached', [name, nodes.List(values)]), [], [], body
+        ).set_lineno(lineno)
+
+    def render_cached(self, name, values, caller):
+        """Return the cached fragment for name and values, rendering it on a miss"""
+        key = (name, hashlib.sha1(repr(values).encode('utf-8')).hexdigest())
+        fragment = self.environment.fragment_cache.get(key)
+        if fragment is not None:
+            return fragment
+        if self.environment.is_async:
+            return self.render_async(key, caller)
+
+        fragment = caller()
+        self.environment.fragment_cache.store(key, fragment)
+        return fragment
+
+    async def render_async(self, key, caller):
+        """Render and cache a fragment in an async environment (the async gateway)"""
+        fragment = await caller()
+        self.environment.fragment_cache.store(key, fragment)
+        return fragment
+
+def init_app(app):
+    """Enable {% cache %} blocks in an app's templates"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -12,13 +12,18 @@ db = SQLAlchemy(model_class=Base)
 class Transaction(db.Model):
     """Transaction model for transaction service"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_account_timestamp', 'account_id', 'timestamp'),
+        db.Index('ix_transactions_from_account_timestamp', 'from_account_id', 'timestamp'),
+        db.Index('ix_transactions_to_account_timestamp', 'to_account_id', 'timestamp'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     transaction_type = db.Column(db.String(20), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     description = db.Column(db.String(200))
     status = db.Column(db.String(20), default='pending')
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # For deposit/withdrawal
     account_id = db.Column(db.String(36))
@@ -46,4 +51,48 @@ class Transaction(db.Model):
             data['to_account_id'] = self.to_account_id
             data['transfer_type'] = self.transfer_type
             
-        return data
\ No newline at end of file
+        return data
+
+class Posting(db.Model):
+    """Append-only ledger entry moving money into or out of one account"""
+    __tablename__ = 'postings'
+    __table_args__ = (
+        db.Index('ix_postings_account_id', 'account_id', 'id'),
+    )
+    
+    # Autoincrementing id gives the order postings are replayed in
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.String(36), nullable=False)
+    transaction_id = db.Column(db.String(36))  # None for an account's opening balance
+    amount = db.Column(db.Float, nullable=False)  # Credits positive, debits negative
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        """Convert Posting object to dictionary"""
+        return {
+            'id': self.id,
+            'account_id': self.account_id,
+            'transaction_id': self.transaction_id,
+            'amount': self.amount,
+            'created_at': self.created_at.isoformat()
+        }
+
+class BalanceSnapshot(db.Model):
+    """Account balance after a given posting, used as a checkpoint when replaying postings"""
+    __tablename__ = 'balance_snapshots'
+    __table_args__ = (
+        db.Index('ix_balance_snapshots_account_posting', 'account_id', 'posting_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.String(36), nullable=False)
+    posting_id = db.Column(db.Integer, nullable=False)  # Last posting included in the balance
+    balance = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # When that posting was made
+
+class LedgerAccount(db.Model):
+    """One row per account in the ledger, locked while its balance is checked and posted to"""
+    __tablename__ = 'ledger_accounts'
+    
+    account_id = db.Column(db.String(36), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -1,71 +1,52 @@
-import consul
 import os
 import logging
+import threading
 import requests
+import service_client
+import http_responses
 import jwt
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import wraps
 from flask import Flask, request, jsonify
-from transaction_service.transaction_models import db, Transaction
+from sqlalchemy import func, case, text
+from sqlalchemy.dialects import postgresql, sqlite
+from transaction_service.transaction_models import db, Transaction, Posting, BalanceSnapshot, LedgerAccount
+from ownership_cache import OwnershipCache
+from event_bus import EventBus
+from http_caching import conditional_json, etag_for
+from service_registry import register_in_background
+from schema_upgrade import create_missing_indexes
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+SERVICE_NAME = "transaction-service"
+# Address this instance listens on and registers in the service registry; give each instance
+# its own (a host or IP other services can reach) when running several
+SERVICE_HOST = os.environ.get("TRANSACTION_SERVICE_HOST", "localhost")
+SERVICE_PORT = int(os.environ.get("TRANSACTION_SERVICE_PORT", 8003))
+
 # Initialize Flask app
 app = Flask(__name__)
+http_responses.init_app(app)
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("TRANSACTION_DATABASE_URL")
 app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "transaction_service_secret_key")
 
 # Initialize extensions
 db.init_app(app)
 
-# Create tables
-with app.app_context():
-    db.create_all()
-
-# Consul configuration
-CONSUL_HOST = os.environ.get("CONSUL_HOST", "localhost")
-CONSUL_PORT = int(os.environ.get("CONSUL_PORT", 8500))
-SERVICE_NAME = "transaction-service"
-SERVICE_ID = f"{SERVICE_NAME}-{os.urandom(8).hex()}"
-SERVICE_PORT = 8003
-
-# Initialize Consul client
-consul_client = consul.Consul(host=CONSUL_HOST, port=CONSUL_PORT)
-
-# Register service with Consul
-def register_service():
-    consul_client.agent.service.register(
-        name=SERVICE_NAME,
-        service_id=SERVICE_ID,
-        address="localhost",
-        port=SERVICE_PORT,
-        check=consul.Check.http(
-            f"http://localhost:{SERVICE_PORT}/api/health",
-            interval="10s",
-            timeout="5s",
-        ),
-    )
-    logger.info(f"Registered service with Consul as {SERVICE_ID}")
-
-# Deregister service from Consul
-def deregister_service():
-    consul_client.agent.service.deregister(SERVICE_ID)
-    logger.info(f"Deregistered service from Consul: {SERVICE_ID}")
-
-# Register service on startup
-with app.app_context():
-    register_service()
-
-# Deregister service on shutdown
-import atexit
-atexit.register(deregister_service)
-
 # Service URLs
 AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://localhost:8001")
 ACCOUNT_SERVICE_URL = os.environ.get("ACCOUNT_SERVICE_URL", "http://localhost:8002")
 
+# user_id -> owned account ids, used for access checks
+ownership_cache = OwnershipCache(ACCOUNT_SERVICE_URL)
+
+# Cross-service change notifications
+event_bus = EventBus(SERVICE_NAME)
+ownership_cache.listen(event_bus)
+
 # Helper functions
 def token_required(f):
     """Decorator for endpoints that require a valid JWT token"""
@@ -82,7 +63,7 @@ def token_required(f):
         
         try:
             # Verify token with auth service
-            response = requests.get(
+            response = service_client.get(
                 f"{AUTH_SERVICE_URL}/api/auth/verify_token",
                 headers={'Authorization': f'Bearer {token}'}
             )
@@ -111,7 +92,7 @@ def admin_required(f):
         token = request.headers.get('Authorization').split(' ')[1]
         
         try:
-            response = requests.get(
+            response = service_client.get(
                 f"{AUTH_SERVICE_URL}/api/auth/verify_admin",
                 headers={'Authorization': f'Bearer {token}'}
             )
@@ -126,6 +107,231 @@ def admin_required(f):
     
     return decorated
 
+# Supported time-series bucket sizes and the largest series a single request may ask for
+TIMESERIES_INTERVALS = ('day', 'week', 'month')
+MAX_TIMESERIES_BUCKETS = int(os.environ.get("MAX_TIMESERIES_BUCKETS", 400))
+
+# 'service' moves money with balance updates in the account service, 'ledger' writes postings
+# here and lets the account service project balances from ledger.posted events
+BALANCE_MODE = os.environ.get("BALANCE_MODE", "service")
+# Postings per account between balance snapshots, which bounds the cost of rebuilding a balance
+LEDGER_SNAPSHOT_INTERVAL = int(os.environ.get("LEDGER_SNAPSHOT_INTERVAL", 100))
+
+# Serializes balance checks and postings within this process so concurrent debits cannot
+# overdraw an account; lock_ledger_accounts covers other worker processes and instances
+ledger_lock = threading.Lock()
+
+def account_scope_filter(account_ids):
+    """Build a filter matching transactions that touch any of the given accounts"""
+    return (
+        (Transaction.transaction_type.in_(['deposit', 'withdrawal']) & Transaction.account_id.in_(account_ids)) |
+        ((Transaction.transaction_type == 'transfer') &
+         (Transaction.from_account_id.in_(account_ids) | Transaction.to_account_id.in_(account_ids)))
+    )
+
+def transaction_filters(args):
+    """SQL filters for the optional start, end, type, status and min_amount query parameters.
+    Bounds are YYYY-MM-DD or ISO datetimes; a date-only end bound includes that whole day.
+    Raises ValueError for malformed values."""
+    filters = []
+    
+    if args.get('start'):
+        filters.append(Transaction.timestamp >= datetime.fromisoformat(args['start']))
+    
+    if args.get('end'):
+        end = datetime.fromisoformat(args['end'])
+        if len(args['end']) == 10:
+            filters.append(Transaction.timestamp < end + timedelta(days=1))
+        else:
+            filters.append(Transaction.timestamp <= end)
+    
+    if args.get('type'):
+        filters.append(Transaction.transaction_type == args['type'])
+    
+    if args.get('status'):
+        filters.append(Transaction.status == args['status'])
+    
+    if args.get('min_amount'):
+        filters.append(Transaction.amount >= float(args['min_amount']))
+    
+    return filters
+
+def bucket_expression(interval):
+    """SQL expression truncating a transaction timestamp to the start of its bucket (YYYY-MM-DD)"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(func.date_trunc(interval, Transaction.timestamp), 'YYYY-MM-DD')
+    
+    # SQLite has no date_trunc; emulate it with date modifiers (weeks start on Monday)
+    if interval == 'day':
+        return func.date(Transaction.timestamp)
+    if interval == 'week':
+        return func.date(Transaction.timestamp, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m-01', Transaction.timestamp)
+
+def bucket_starts(start_date, end_date, interval):
+    """List the start date of every bucket between start_date and end_date (inclusive)"""
+    if interval == 'day':
+        current = start_date
+    elif interval == 'week':
+        current = start_date - timedelta(days=start_date.weekday())
+    else:
+        current = start_date.replace(day=1)
+    
+    buckets = []
+    while current <= end_date:
+        buckets.append(current)
+        if interval == 'day':
+            current += timedelta(days=1)
+        elif interval == 'week':
+            current += timedelta(weeks=1)
+        elif current.month == 12:
+            current = current.replace(year=current.year + 1, month=1)
+        else:
+            current = current.replace(month=current.month + 1)
+    return buckets
+
+def publish_completed(transaction):
+    """Notify other services that a transaction has completed"""
+    event_bus.publish('transaction.completed', transaction.to_dict())
+
+def ledger_balance(account_id, as_of=None):
+    """Rebuild an account's balance from its latest snapshot plus the postings made since,
+    optionally as it stood at as_of. Returns (balance, last posting id, postings replayed),
+    or None if the account had no postings by then."""
+    snapshot_query = BalanceSnapshot.query.filter_by(account_id=account_id)
+    posting_filters = [Posting.account_id == account_id]
+    if as_of is not None:
+        snapshot_query = snapshot_query.filter(BalanceSnapshot.created_at <= as_of)
+        posting_filters.append(Posting.created_at <= as_of)
+    
+    snapshot = snapshot_query.order_by(BalanceSnapshot.posting_id.desc()).first()
+    start = snapshot.posting_id if snapshot else 0
+    
+    total, last_posting_id, replayed = db.session.query(
+        func.coalesce(func.sum(Posting.amount), 0),
+        func.max(Posting.id),
+        func.count(Posting.id)
+    ).filter(Posting.id > start, *posting_filters).one()
+    
+    if snapshot is None and replayed == 0:
+        return None
+    
+    balance = (snapshot.balance if snapshot else 0) + total
+    return balance, last_posting_id or start, replayed
+
+def net_change_after(account_id, as_of):
+    """Net effect on an account of the completed transactions made after as_of"""
+    signed_amount = case(
+        (Transaction.transaction_type == 'deposit', Transaction.amount),
+        (Transaction.transaction_type == 'withdrawal', -Transaction.amount),
+        (Transaction.to_account_id == account_id, Transaction.amount),
+        else_=-Transaction.amount
+    )
+    return db.session.query(func.coalesce(func.sum(signed_amount), 0)).filter(
+        account_scope_filter([account_id]),
+        Transaction.status == 'completed',
+        Transaction.timestamp > as_of
+    ).scalar()
+
+def lock_ledger_accounts(account_ids):
+    """Lock the accounts' ledger_accounts rows (SELECT ... FOR UPDATE) until the database
+    transaction ends, so balance checks and postings for an account are serialized across
+    worker processes and service instances. Rows are created on first use.
+    
+    SQLite ignores FOR UPDATE, and pysqlite runs SELECTs outside any transaction, so there
+    BEGIN IMMEDIATE takes the database write lock before balances are read."""
+    if db.engine.dialect.name == 'sqlite':
+        connection = db.session.connection().connection.dbapi_connection
+        # Already in a transaction means a write has run, which holds the same lock
+        if not connection.in_transaction:
+            db.session.execute(text("BEGIN IMMEDIATE"))
+    
+    account_ids = sorted(account_ids)
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    db.session.execute(
+        insert(LedgerAccount)
+        .values([{'account_id': account_id, 'created_at': datetime.utcnow()} for account_id in account_ids])
+        .on_conflict_do_nothing(index_elements=['account_id'])
+    )
+    LedgerAccount.query.filter(LedgerAccount.account_id.in_(account_ids)) \
+        .order_by(LedgerAccount.account_id).with_for_update().all()
+
+def opening_balances(account_ids, known_balances):
+    """Get the balances to open the ledger with for accounts it has no postings for yet"""
+    balances = {}
+    for account_id in account_ids:
+        if Posting.query.filter_by(account_id=account_id).first() is not None:
+            continue
+        
+        if account_id in known_balances:
+            balances[account_id] = known_balances[account_id]
+            continue
+        
+        response = service_client.get(f"{ACCOUNT_SERVICE_URL}/api/accounts/validate/{account_id}")
+        response.raise_for_status()
+        result = response.json()
+        if not result.get('valid'):
+            raise ValueError(result.get('message', 'Account is not active'))
+        balances[account_id] = result['account']['balance']
+    return balances
+
+def post_to_ledger(transaction, amounts, known_balances):
+    """Record a completed transaction and its postings in one database transaction.
+    
+    amounts maps account ids to signed amounts. Accounts seen for the first time get an
+    opening posting for their current balance. Raises ValueError if a debit would overdraw.
+    """
+    openings = opening_balances(amounts, known_balances)
+    
+    with ledger_lock:
+        lock_ledger_accounts(amounts)
+        balances = {}
+        postings = []
+        for account_id, amount in amounts.items():
+            current = ledger_balance(account_id)
+            if current is None:
+                balance, replayed = openings[account_id], 1
+                postings.append(Posting(account_id=account_id, amount=balance))
+            else:
+                balance, _, replayed = current
+            
+            if amount < 0 and balance + amount < 0:
+                db.session.rollback()
+                raise ValueError('Insufficient funds')
+            
+            balances[account_id] = (balance + amount, replayed + 1)
+        
+        transaction.status = 'completed'
+        db.session.add(transaction)
+        db.session.flush()
+        
+        for account_id, amount in amounts.items():
+            postings.append(Posting(account_id=account_id, transaction_id=transaction.id, amount=amount))
+        db.session.add_all(postings)
+        db.session.flush()
+        
+        last_postings = {posting.account_id: posting for posting in postings}
+        for account_id, (balance, since_snapshot) in balances.items():
+            if since_snapshot >= LEDGER_SNAPSHOT_INTERVAL:
+                posting = last_postings[account_id]
+                db.session.add(BalanceSnapshot(
+                    account_id=account_id,
+                    posting_id=posting.id,
+                    balance=balance,
+                    created_at=posting.created_at
+                ))
+        
+        db.session.commit()
+    
+    for account_id, (balance, _) in balances.items():
+        event_bus.publish('ledger.posted', {
+            'account_id': account_id,
+            'balance': balance,
+            'posting_id': last_postings[account_id].id,
+            'transaction_id': transaction.id
+        })
+    publish_completed(transaction)
+
 # Routes
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -135,21 +341,19 @@ def health_check():
 @app.route('/api/transactions/list', methods=['GET'])
 @token_required
 def list_transactions(current_user):
-    """List all transactions for the current user"""
+    """List all transactions for the current user (filterable by start, end, type, status, min_amount)"""
+    try:
+        filters = transaction_filters(request.args)
+    except ValueError:
+        return jsonify({'message': 'Invalid filter: start/end must be ISO dates and min_amount a number'}), 400
+    
     # First get all accounts for the user
     try:
         token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
-            f"{ACCOUNT_SERVICE_URL}/api/accounts/list",
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        
-        if not response.ok:
-            return jsonify({'message': 'Failed to retrieve accounts'}), response.status_code
-            
-        accounts = response.json().get('accounts', [])
-        account_ids = [account['id'] for account in accounts]
+        account_ids = list(ownership_cache.get(current_user['user_id'], token))
         
+    except requests.HTTPError as e:
+        return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
     except requests.RequestException:
         return jsonify({'message': 'Account service unavailable'}), 503
     
@@ -158,13 +362,15 @@ def list_transactions(current_user):
         # Query for deposit/withdrawal transactions
         deposit_withdrawal_transactions = Transaction.query.filter(
             Transaction.transaction_type.in_(['deposit', 'withdrawal']),
-            Transaction.account_id.in_(account_ids)
+            Transaction.account_id.in_(account_ids),
+            *filters
         ).all()
         
         # Query for transfer transactions
         transfer_transactions = Transaction.query.filter(
             Transaction.transaction_type == 'transfer',
-            (Transaction.from_account_id.in_(account_ids) | Transaction.to_account_id.in_(account_ids))
+            (Transaction.from_account_id.in_(account_ids) | Transaction.to_account_id.in_(account_ids)),
+            *filters
         ).all()
         
         # Combine and sort by timestamp (descending)
@@ -184,17 +390,10 @@ def recent_transactions(current_user):
     # First get all accounts for the user
     try:
         token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
-            f"{ACCOUNT_SERVICE_URL}/api/accounts/list",
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        
-        if not response.ok:
-            return jsonify({'message': 'Failed to retrieve accounts'}), response.status_code
-            
-        accounts = response.json().get('accounts', [])
-        account_ids = [account['id'] for account in accounts]
+        account_ids = list(ownership_cache.get(current_user['user_id'], token))
         
+    except requests.HTTPError as e:
+        return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
     except requests.RequestException:
         return jsonify({'message': 'Account service unavailable'}), 503
     
@@ -224,33 +423,38 @@ def recent_transactions(current_user):
 @app.route('/api/transactions/account/<account_id>', methods=['GET'])
 @token_required
 def account_transactions(current_user, account_id):
-    """Get transactions for a specific account"""
-    # Verify account access
+    """Get transactions for a specific account (filterable by start, end, type, status, min_amount)"""
     try:
-        token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
-            f"{ACCOUNT_SERVICE_URL}/api/accounts/details/{account_id}",
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        
-        if not response.ok:
-            return jsonify({'message': 'Failed to access account'}), response.status_code
-            
-    except requests.RequestException:
-        return jsonify({'message': 'Account service unavailable'}), 503
+        filters = transaction_filters(request.args)
+    except ValueError:
+        return jsonify({'message': 'Invalid filter: start/end must be ISO dates and min_amount a number'}), 400
+    
+    # Verify account access (admins can read any account)
+    if current_user['role'] != 'admin':
+        try:
+            token = request.headers.get('Authorization').split(' ')[1]
+            if not ownership_cache.owns_any(current_user['user_id'], token, [account_id]):
+                return jsonify({'message': 'Failed to access account'}), 403
+                
+        except requests.HTTPError as e:
+            return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
+        except requests.RequestException:
+            return jsonify({'message': 'Account service unavailable'}), 503
     
     # Get transactions for this account
     with app.app_context():
         # Query for deposit/withdrawal transactions
         deposit_withdrawal_transactions = Transaction.query.filter(
             Transaction.transaction_type.in_(['deposit', 'withdrawal']),
-            Transaction.account_id == account_id
+            Transaction.account_id == account_id,
+            *filters
         ).all()
         
         # Query for transfer transactions
         transfer_transactions = Transaction.query.filter(
             Transaction.transaction_type == 'transfer',
-            (Transaction.from_account_id == account_id) | (Transaction.to_account_id == account_id)
+            (Transaction.from_account_id == account_id) | (Transaction.to_account_id == account_id),
+            *filters
         ).all()
         
         # Combine and sort by timestamp (descending)
@@ -261,6 +465,66 @@ def account_transactions(current_user, account_id):
             'transactions': [transaction.to_dict() for transaction in all_transactions]
         }), 200
 
+@app.route('/api/transactions/balance/<account_id>', methods=['GET'])
+@token_required
+def balance_as_of(current_user, account_id):
+    """Get an account's balance as it stood at as_of (YYYY-MM-DD for end of day, or an ISO datetime)"""
+    as_of_raw = request.args.get('as_of')
+    try:
+        as_of = datetime.fromisoformat(as_of_raw) if as_of_raw else datetime.utcnow()
+    except ValueError:
+        return jsonify({'message': 'Invalid as_of: must be an ISO date or datetime'}), 400
+    if as_of_raw and len(as_of_raw) == 10:
+        as_of = datetime.combine(as_of.date(), datetime.max.time())
+    
+    try:
+        token = request.headers.get('Authorization').split(' ')[1]
+        
+        # Verify account access (admins can read any account)
+        if current_user['role'] != 'admin' and not ownership_cache.owns_any(current_user['user_id'], token, [account_id]):
+            return jsonify({'message': 'Failed to access account'}), 403
+        
+        with app.app_context():
+            # Nearest checkpoint at or before as_of plus the postings after it
+            result = ledger_balance(account_id, as_of)
+            if result is not None:
+                balance, _, replayed = result
+                return jsonify({
+                    'account_id': account_id,
+                    'as_of': as_of.isoformat(),
+                    'balance': balance,
+                    'source': 'ledger',
+                    'replayed_postings': replayed
+                }), 200
+            
+            # No ledger history that far back: walk back from the current balance instead
+            response = service_client.get(
+                f"{ACCOUNT_SERVICE_URL}/api/accounts/details/{account_id}",
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            if not response.ok:
+                return jsonify({'message': 'Account not accessible'}), response.status_code
+            account = response.json()
+            
+            # The initial deposit is not a transaction, so walking back past the opening would report it
+            if as_of < datetime.fromisoformat(account['created_at']):
+                return jsonify({'message': 'Account did not exist at as_of'}), 404
+            
+            current = ledger_balance(account_id)
+            current_balance = current[0] if current is not None else account['balance']
+            
+            return jsonify({
+                'account_id': account_id,
+                'as_of': as_of.isoformat(),
+                'balance': current_balance - net_change_after(account_id, as_of),
+                'source': 'transactions'
+            }), 200
+            
+    except requests.HTTPError as e:
+        return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
+    except requests.RequestException:
+        return jsonify({'message': 'Account service unavailable'}), 503
+
 @app.route('/api/transactions/details/<transaction_id>', methods=['GET'])
 @token_required
 def transaction_details(current_user, transaction_id):
@@ -275,39 +539,106 @@ def transaction_details(current_user, transaction_id):
         # For deposit/withdrawal, check if the account belongs to the user
         # For transfer, check if either the from or to account belongs to the user
         
-        # Get user's accounts
-        try:
-            token = request.headers.get('Authorization').split(' ')[1]
-            response = requests.get(
-                f"{ACCOUNT_SERVICE_URL}/api/accounts/list",
-                headers={'Authorization': f'Bearer {token}'}
-            )
+        # Admin can access any transaction; otherwise check the involved accounts against the ownership cache
+        if current_user['role'] != 'admin':
+            if transaction.transaction_type == 'transfer':
+                involved_ids = [transaction.from_account_id, transaction.to_account_id]
+            else:
+                involved_ids = [transaction.account_id]
             
-            if not response.ok:
-                return jsonify({'message': 'Failed to retrieve accounts'}), response.status_code
-                
-            accounts = response.json().get('accounts', [])
-            account_ids = [account['id'] for account in accounts]
-            
-            # Check if user has access to the transaction
-            has_access = False
-            if transaction.transaction_type in ['deposit', 'withdrawal']:
-                has_access = transaction.account_id in account_ids
-            elif transaction.transaction_type == 'transfer':
-                has_access = (transaction.from_account_id in account_ids or 
-                              transaction.to_account_id in account_ids)
-            
-            # Admin can access any transaction
-            if current_user['role'] == 'admin':
-                has_access = True
-                
-            if not has_access:
-                return jsonify({'message': 'Access denied'}), 403
-                
-        except requests.RequestException:
-            return jsonify({'message': 'Account service unavailable'}), 503
+            try:
+                token = request.headers.get('Authorization').split(' ')[1]
+                if not ownership_cache.owns_any(current_user['user_id'], token, involved_ids):
+                    return jsonify({'message': 'Access denied'}), 403
+                    
+            except requests.HTTPError as e:
+                return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
+            except requests.RequestException:
+                return jsonify({'message': 'Account service unavailable'}), 503
         
-        return jsonify(transaction.to_dict()), 200
+        # Only the status of a pending transaction can still change. The timestamp is the creation
+        # time, not when the status last changed, so no Last-Modified is sent; the ETag covers it
+        return conditional_json(
+            etag_for(transaction.id, transaction.status),
+            transaction.to_dict,
+            immutable=transaction.status in ('completed', 'failed')
+        )
+
+@app.route('/api/transactions/timeseries', methods=['GET'])
+@token_required
+def transaction_timeseries(current_user):
+    """Completed transaction counts and amounts per time bucket and type"""
+    interval = request.args.get('interval', 'day')
+    account_id = request.args.get('account_id')
+    
+    if interval not in TIMESERIES_INTERVALS:
+        return jsonify({'message': f'Invalid interval. Must be one of: {", ".join(TIMESERIES_INTERVALS)}'}), 400
+    
+    try:
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() if request.args.get('end_date') else datetime.utcnow().date()
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() if request.args.get('start_date') else end_date - timedelta(days=30)
+    except ValueError:
+        return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    if start_date > end_date:
+        return jsonify({'message': 'start_date must not be after end_date'}), 400
+    
+    buckets = bucket_starts(start_date, end_date, interval)
+    if len(buckets) > MAX_TIMESERIES_BUCKETS:
+        return jsonify({'message': f'Requested range spans more than {MAX_TIMESERIES_BUCKETS} buckets'}), 400
+    
+    # Resolve which accounts the series covers
+    try:
+        token = request.headers.get('Authorization').split(' ')[1]
+        if account_id:
+            if (current_user['role'] != 'admin' and
+                    not ownership_cache.owns_any(current_user['user_id'], token, [account_id])):
+                return jsonify({'message': 'Failed to access account'}), 403
+                
+            account_ids = [account_id]
+        else:
+            account_ids = list(ownership_cache.get(current_user['user_id'], token))
+            
+    except requests.HTTPError as e:
+        return jsonify({'message': 'Failed to retrieve accounts'}), e.response.status_code
+    except requests.RequestException:
+        return jsonify({'message': 'Account service unavailable'}), 503
+    
+    # Aggregate in the database so the payload grows with buckets, not transactions
+    with app.app_context():
+        bucket = bucket_expression(interval).label('bucket')
+        rows = db.session.query(
+            bucket,
+            Transaction.transaction_type,
+            func.count(Transaction.id),
+            func.sum(Transaction.amount)
+        ).filter(
+            account_scope_filter(account_ids),
+            Transaction.status == 'completed',
+            # The first week or month bucket may start before start_date; it only counts from start_date
+            Transaction.timestamp >= datetime.combine(start_date, datetime.min.time()),
+            Transaction.timestamp < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        ).group_by(bucket, Transaction.transaction_type).all()
+    
+    series = {
+        b.isoformat(): {'bucket': b.isoformat(), 'count': 0, 'amount': 0, 'by_type': {}}
+        for b in buckets
+    }
+    for bucket_key, t_type, count, amount in rows:
+        point = series.get(str(bucket_key)[:10])
+        if point is None:
+            continue
+        point['count'] += count
+        point['amount'] += amount or 0
+        point['by_type'][t_type] = {'count': count, 'amount': amount or 0}
+    
+    return jsonify({
+        'interval': interval,
+        'account_id': account_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'series': list(series.values())
+    }), 200
 
 @app.route('/api/transactions/transfer', methods=['POST'])
 @token_required
@@ -336,27 +667,37 @@ def transfer(current_user):
     try:
         token = request.headers.get('Authorization').split(' ')[1]
         
-        # Verify source account
-        response = requests.get(
-            f"{ACCOUNT_SERVICE_URL}/api/accounts/details/{from_account_id}",
+        # Look up source and target account in one call
+        response = service_client.post(
+            f"{ACCOUNT_SERVICE_URL}/api/accounts/batch",
+            json={'ids': [from_account_id, to_account_id]},
             headers={'Authorization': f'Bearer {token}'}
         )
         
         if not response.ok:
-            return jsonify({'message': 'Source account not accessible'}), response.status_code
+            return jsonify({'message': 'Failed to retrieve accounts'}), response.status_code
             
-        from_account = response.json()
+        accounts = {account['id']: account for account in response.json().get('accounts', [])}
         
-        # Verify target account is valid
-        response = requests.get(
-            f"{ACCOUNT_SERVICE_URL}/api/accounts/validate/{to_account_id}"
-        )
+        # Verify source account
+        from_account = accounts.get(from_account_id)
+        if not from_account:
+            return jsonify({'message': 'Source account not accessible'}), 404
+        
+        if not from_account['owned'] and current_user['role'] != 'admin':
+            return jsonify({'message': 'Source account not accessible'}), 403
+        
+        for account in accounts.values():
+            if account['owned']:
+                ownership_cache.note_owned(current_user['user_id'], account['id'])
         
-        if not response.ok or not response.json().get('valid', False):
+        # Verify target account is valid
+        to_account = accounts.get(to_account_id)
+        if not to_account or to_account['status'] != 'active':
             return jsonify({'message': 'Target account is invalid or inactive'}), 400
             
-        # Check if source account has sufficient funds
-        if from_account['balance'] < amount:
+        # Check if source account has sufficient funds (the ledger checks its own balance)
+        if BALANCE_MODE != 'ledger' and from_account['balance'] < amount:
             return jsonify({'message': 'Insufficient funds'}), 400
             
         # Process transfer
@@ -372,11 +713,28 @@ def transfer(current_user):
                 transfer_type=transfer_type
             )
             
+            if BALANCE_MODE == 'ledger':
+                if from_account['status'] != 'active':
+                    return jsonify({'message': 'Source account is not active'}), 400
+                # Balances are only returned for accounts the caller may see; the rest are looked up
+                known_balances = {
+                    account['id']: account['balance'] for account in accounts.values() if 'balance' in account
+                }
+                post_to_ledger(
+                    transaction,
+                    {from_account_id: -amount, to_account_id: amount},
+                    known_balances
+                )
+                return jsonify({
+                    'message': 'Transfer completed successfully',
+                    'transaction': transaction.to_dict()
+                }), 201
+            
             db.session.add(transaction)
             db.session.commit()
             
             # Debit source account
-            response = requests.post(
+            response = service_client.post(
                 f"{ACCOUNT_SERVICE_URL}/api/accounts/balance/update",
                 json={
                     'account_id': from_account_id,
@@ -392,7 +750,7 @@ def transfer(current_user):
                 return jsonify({'message': 'Failed to debit source account'}), 500
                 
             # Credit target account
-            response = requests.post(
+            response = service_client.post(
                 f"{ACCOUNT_SERVICE_URL}/api/accounts/balance/update",
                 json={
                     'account_id': to_account_id,
@@ -403,7 +761,7 @@ def transfer(current_user):
             
             if not response.ok:
                 # Attempt to refund source account
-                requests.post(
+                service_client.post(
                     f"{ACCOUNT_SERVICE_URL}/api/accounts/balance/update",
                     json={
                         'account_id': from_account_id,
@@ -419,12 +777,15 @@ def transfer(current_user):
             # Update transaction status to completed
             transaction.status = 'completed'
             db.session.commit()
+            publish_completed(transaction)
             
             return jsonify({
                 'message': 'Transfer completed successfully',
                 'transaction': transaction.to_dict()
             }), 201
             
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except requests.RequestException:
         return jsonify({'message': 'Account service unavailable'}), 503
 
@@ -449,7 +810,7 @@ def deposit(current_user):
     # Verify account belongs to the user
     try:
         token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
+        response = service_client.get(
             f"{ACCOUNT_SERVICE_URL}/api/accounts/details/{account_id}",
             headers={'Authorization': f'Bearer {token}'}
         )
@@ -458,6 +819,7 @@ def deposit(current_user):
             return jsonify({'message': 'Account not accessible'}), response.status_code
             
         account = response.json()
+        ownership_cache.note_owned(account['user_id'], account_id)
         
         # Process deposit
         with app.app_context():
@@ -470,11 +832,20 @@ def deposit(current_user):
                 account_id=account_id
             )
             
+            if BALANCE_MODE == 'ledger':
+                if account['status'] != 'active':
+                    return jsonify({'message': 'Account is not active'}), 400
+                post_to_ledger(transaction, {account_id: amount}, {account_id: account['balance']})
+                return jsonify({
+                    'message': 'Deposit completed successfully',
+                    'transaction': transaction.to_dict()
+                }), 201
+            
             db.session.add(transaction)
             db.session.commit()
             
             # Credit account
-            response = requests.post(
+            response = service_client.post(
                 f"{ACCOUNT_SERVICE_URL}/api/accounts/balance/update",
                 json={
                     'account_id': account_id,
@@ -491,12 +862,15 @@ def deposit(current_user):
             # Update transaction status to completed
             transaction.status = 'completed'
             db.session.commit()
+            publish_completed(transaction)
             
             return jsonify({
                 'message': 'Deposit completed successfully',
                 'transaction': transaction.to_dict()
             }), 201
             
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except requests.RequestException:
         return jsonify({'message': 'Account service unavailable'}), 503
 
@@ -521,7 +895,7 @@ def withdraw(current_user):
     # Verify account belongs to the user and has sufficient funds
     try:
         token = request.headers.get('Authorization').split(' ')[1]
-        response = requests.get(
+        response = service_client.get(
             f"{ACCOUNT_SERVICE_URL}/api/accounts/details/{account_id}",
             headers={'Authorization': f'Bearer {token}'}
         )
@@ -530,9 +904,10 @@ def withdraw(current_user):
             return jsonify({'message': 'Account not accessible'}), response.status_code
             
         account = response.json()
+        ownership_cache.note_owned(account['user_id'], account_id)
         
-        # Check if account has sufficient funds
-        if account['balance'] < amount:
+        # Check if account has sufficient funds (the ledger checks its own balance)
+        if BALANCE_MODE != 'ledger' and account['balance'] < amount:
             return jsonify({'message': 'Insufficient funds'}), 400
             
         # Process withdrawal
@@ -546,11 +921,20 @@ def withdraw(current_user):
                 account_id=account_id
             )
             
+            if BALANCE_MODE == 'ledger':
+                if account['status'] != 'active':
+                    return jsonify({'message': 'Account is not active'}), 400
+                post_to_ledger(transaction, {account_id: -amount}, {account_id: account['balance']})
+                return jsonify({
+                    'message': 'Withdrawal completed successfully',
+                    'transaction': transaction.to_dict()
+                }), 201
+            
             db.session.add(transaction)
             db.session.commit()
             
             # Debit account
-            response = requests.post(
+            response = service_client.post(
                 f"{ACCOUNT_SERVICE_URL}/api/accounts/balance/update",
                 json={
                     'account_id': account_id,
@@ -567,12 +951,15 @@ def withdraw(current_user):
             # Update transaction status to completed
             transaction.status = 'completed'
             db.session.commit()
+            publish_completed(transaction)
             
             return jsonify({
                 'message': 'Withdrawal completed successfully',
                 'transaction': transaction.to_dict()
             }), 201
             
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except requests.RequestException:
         return jsonify({'message': 'Account service unavailable'}), 503
 
@@ -616,6 +1003,9 @@ def record_transaction():
         db.session.add(transaction)
         db.session.commit()
         
+        if transaction.status == 'completed':
+            publish_completed(transaction)
+        
         return jsonify({
             'message': 'Transaction recorded successfully',
             'transaction': transaction.to_dict()
@@ -625,12 +1015,39 @@ def record_transaction():
 @token_required
 @admin_required
 def get_all_transactions(current_user):
-    """Get all transactions (admin only)"""
+    """Get all transactions (admin only, filterable by start, end, type, status, min_amount)"""
+    try:
+        filters = transaction_filters(request.args)
+    except ValueError:
+        return jsonify({'message': 'Invalid filter: start/end must be ISO dates and min_amount a number'}), 400
+    
     with app.app_context():
-        transactions = Transaction.query.order_by(Transaction.timestamp.desc()).all()
+        transactions = Transaction.query.filter(*filters).order_by(Transaction.timestamp.desc()).all()
         return jsonify({
             'transactions': [transaction.to_dict() for transaction in transactions]
         }), 200
 
+# Startup runs once per process, whichever entry point asks for the app first
+started = False
+
+def create_app():
+    """Run the service's startup tasks once and return the app.
+    Importing this module performs no database or network I/O; servers call this instead."""
+    global started
+    if started:
+        return app
+    started = True
+    
+    # Ledger balances reach the account service only through ledger.posted events
+    if BALANCE_MODE == 'ledger' and not event_bus.is_shared():
+        raise RuntimeError("BALANCE_MODE=ledger requires a shared event bus; set EVENT_BUS_PATH")
+    
+    with app.app_context():
+        db.create_all()
+        create_missing_indexes(db, Transaction)
+    event_bus.start()
+    register_in_background(SERVICE_NAME, SERVICE_PORT, address=SERVICE_HOST)
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='localhost', port=8003)
\ No newline at end of file
+    create_app().run(debug=True, host=SERVICE_HOST, port=SERVICE_PORT)
\ No newline at end of file